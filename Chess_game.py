@@ -5,9 +5,67 @@ from PyQt5 import QtCore
 from PyQt5.QtGui import QIcon
 import chess
 import random
-from ai_logic import ai_play
+import threading
+import ai_logic
+from ai_logic import ai_move, ai_play, principal_variation, stop_search
+from zobrist import zobrist_hash, push_move
 
 color_list = ["#f0d9b5", "#b58863"]
+AI_TIME_LIMIT = 5.0
+PONDER = True
+TT_CACHE = None   # e.g. "tt_cache.bin": transposition table kept between sessions (32 MB at the default size)
+
+
+class SearchThread(QThread):
+    progress = pyqtSignal(int, int, str)
+    move_found = pyqtSignal(object)
+
+    def __init__(self, board, key, time_limit, ponder_move=None):
+        super().__init__()
+        self.board = board.copy()
+        self.key = key
+        self.time_limit = time_limit
+        # a ponder search runs on the position after the expected reply until the
+        # human moves: a ponder hit turns it into the real search, a miss cancels it
+        self.ponder_move = ponder_move
+        self.pondering = ponder_move is not None
+        if ponder_move is not None:
+            self.key = push_move(self.board, ponder_move, key)
+        self.cancelled = False
+        self.done = False
+        self.result = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        if self.pondering:
+            # start_ponder only ponders on positions that aren't over
+            self.result = ai_move(self.board, self.key, depth=ai_logic.MAX_DEPTH, on_iteration=self.report)
+        else:
+            self.result = ai_play(self.board, self.key, time_limit=self.time_limit, on_iteration=self.report)
+        with self.lock:
+            self.done = True
+            emit = not self.pondering and not self.cancelled
+        if emit:
+            self.move_found.emit(self.result)
+
+    def report(self, depth, score, move, nodes, qnodes, elapsed):
+        self.progress.emit(depth, nodes + qnodes, move.uci() if move else "")
+
+    def ponderhit(self):
+        with self.lock:
+            self.pondering = False
+            done = self.done
+            if not done:
+                # time spent pondering counts towards the move's budget
+                ai_logic.SEARCH.deadline = ai_logic.SEARCH.start_time + self.time_limit
+        if done:
+            self.move_found.emit(self.result)
+
+    def cancel(self):
+        self.cancelled = True
+        while self.isRunning():
+            stop_search()
+            self.wait(50)
 
 
 class ChessBoard(QWidget):
@@ -23,11 +81,12 @@ class ChessBoard(QWidget):
         
         self.tiles = {}
         self.board = chess.Board()
-        self.zobrist = 0
-        self.current_hash = self.board._transposition_key()
+        self.current_hash = zobrist_hash(self.board)
 
         self.selected_square = None
         self.human_color = chess.WHITE
+        self.search_thread = None
+        self.ponder_thread = None
         
         self.undo_button = QPushButton()
         self.undo_button.setIcon(QIcon('undo arrow.webp'))
@@ -95,12 +154,19 @@ class ChessBoard(QWidget):
         super().resizeEvent(event)
 
     def undo_move(self):
-        for i in range(2):
+        plies = 2
+        if self.search_thread is not None:
+            # the AI hasn't answered yet, so only the human move is taken back
+            self.cancel_search()
+            plies = 1
+        self.cancel_ponder()
+        for i in range(plies):
             if not self.board.move_stack:
                 break
             
             self.board.pop()
 
+        self.current_hash = zobrist_hash(self.board)
         if not self.board.move_stack:
             self.undo_button.setDisabled(True)
 
@@ -133,6 +199,8 @@ class ChessBoard(QWidget):
  
         
         square = (7 - row) * 8 + col
+        if self.search_thread is not None:
+            return
         
         if self.selected_square == None:
             piece = self.board.piece_at(square) 
@@ -154,8 +222,7 @@ class ChessBoard(QWidget):
                     move = chess.Move(self.selected_square, square, promotion=chess.QUEEN)
             
             if move in self.board.legal_moves:
-                self.current_hash = self.board._transposition_key()
-                self.board.push(move)
+                self.current_hash = push_move(self.board, move, self.current_hash)
                 self.undo_button.setEnabled(True)
                 self.fill_board()
                 self.reset_highlight()
@@ -177,12 +244,33 @@ class ChessBoard(QWidget):
 
     def ai_turn(self):
         self.status_label.setText("Ai is thinking...")
-        QApplication.processEvents()
-        
-        move = ai_play(self.board, self.current_hash)
+        ponder_thread, self.ponder_thread = self.ponder_thread, None
+        if ponder_thread is not None:
+            if self.board.move_stack and ponder_thread.ponder_move == self.board.peek():
+                self.search_thread = ponder_thread
+                ponder_thread.ponderhit()
+                return
+            self.stop_thread(ponder_thread)
+
+        self.search_thread = SearchThread(self.board, self.current_hash, AI_TIME_LIMIT)
+        self.connect_search(self.search_thread)
+        self.search_thread.start()
+
+    def connect_search(self, thread):
+        thread.progress.connect(self.show_progress)
+        thread.move_found.connect(self.on_ai_move)
+
+    def show_progress(self, depth, nodes, best_move):
+        if self.sender() is self.search_thread:
+            self.status_label.setText(f"Ai is thinking... depth {depth}, {nodes} nodes, best {best_move}")
+
+    def on_ai_move(self, move):
+        if self.sender() is not self.search_thread:
+            return
+        self.search_thread.wait()
+        self.search_thread = None
         if move:
-            self.current_hash = self.board._transposition_key()
-            self.board.push(move)
+            self.current_hash = push_move(self.board, move, self.current_hash)
             self.fill_board()
             print(move)
             square_start = move.from_square
@@ -197,7 +285,44 @@ class ChessBoard(QWidget):
                 print("Player in Checkmate !")
             elif self.board.is_check():
                 print("Player in Check !")
+            self.start_ponder()
         self.status_label.setText("Your turn")
+
+    def start_ponder(self):
+        if not PONDER or self.board.is_game_over():
+            return
+        expected = principal_variation(self.board, self.current_hash, 1)
+        if not expected:
+            return
+        after = self.board.copy(stack=False)
+        after.push(expected[0])
+        if after.is_game_over():
+            return
+        self.ponder_thread = SearchThread(self.board, self.current_hash, AI_TIME_LIMIT, ponder_move=expected[0])
+        self.connect_search(self.ponder_thread)
+        self.ponder_thread.start()
+
+    def stop_thread(self, thread):
+        thread.cancel()
+        thread.progress.disconnect()
+        thread.move_found.disconnect()
+
+    def cancel_search(self):
+        if self.search_thread is not None:
+            self.stop_thread(self.search_thread)
+            self.search_thread = None
+        self.status_label.setText("Your turn")
+
+    def cancel_ponder(self):
+        if self.ponder_thread is not None:
+            self.stop_thread(self.ponder_thread)
+            self.ponder_thread = None
+
+    def shutdown(self):
+        self.cancel_search()
+        self.cancel_ponder()
+        if TT_CACHE:
+            ai_logic.save_tt(TT_CACHE)
     
     
     def highlight_square(self, row, col, color):
@@ -240,8 +365,14 @@ class MainWindow(QMainWindow):
         self.setStyleSheet("background-color: #1f5754;")
         self.showMaximized()
 
+    def closeEvent(self, event):
+        self.board.shutdown()
+        super().closeEvent(event)
+
 
 def main():
+    if TT_CACHE:
+        ai_logic.load_tt(TT_CACHE)
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -1,4 +1,5 @@
 import chess
+from array import array
 
 PIECE_VALUES = {
     chess.PAWN: 100,
@@ -165,4 +166,35 @@ end_game_pst_dict = {
     chess.ROOK: ROOK_ENDGAME_PST,
     chess.QUEEN: QUEEN_ENDGAME_PST,
     chess.KING: KING_ENDGAME_PST
-}
\ No newline at end of file
+}
+
+
+# Tapered evaluation: material and PST folded into flat 12 x 64 tables, one
+# for the middlegame and one for the endgame, indexed piece_index * 64 + square
+# and signed for the piece's color. Material counts fully in the middlegame and
+# 0.35 in the endgame, PST bonuses 1.15 and 2.15: the two ends of the linear
+# phase scaling eval used to apply to the summed terms.
+PHASE_MAX = 24
+MG_MATERIAL_SCALE = 1.0
+EG_MATERIAL_SCALE = 0.35
+MG_PST_SCALE = 1.15
+EG_PST_SCALE = 2.15
+
+def piece_index(color, piece_type):
+    # white pawn..king are 0-5, black 6-11
+    return piece_type - 1 if color == chess.WHITE else piece_type + 5
+
+def tapered_tables(material_weight=1.0, pst_weight=1.0):
+    mg = array('d', bytes(8 * 12 * 64))
+    eg = array('d', bytes(8 * 12 * 64))
+    for color in (chess.WHITE, chess.BLACK):
+        sign = 1 if color == chess.WHITE else -1
+        for piece in chess.PIECE_TYPES:
+            base = piece_index(color, piece) * 64
+            value = PIECE_VALUES[piece] * material_weight
+            for sq in chess.SQUARES:
+                # black reads the tables mirrored
+                idx = chess.square_mirror(sq) if color == chess.BLACK else sq
+                mg[base + sq] = sign * (value * MG_MATERIAL_SCALE + pst_dict[piece][idx] * MG_PST_SCALE * pst_weight)
+                eg[base + sq] = sign * (value * EG_MATERIAL_SCALE + end_game_pst_dict[piece][idx] * EG_PST_SCALE * pst_weight)
+    return mg, eg
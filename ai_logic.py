@@ -1,15 +1,162 @@
-import chess, random
+import chess, hashlib, inspect, json, os, random, threading, time
+from zobrist import zobrist_hash, move_changes, push_move, push_null
+from transposition import TranspositionTable, PawnHashTable, EXACT, LOWERBOUND, UPPERBOUND
+from search_stats import SearchStats
+from book import open_book
+from tablebase import open_tablebase, probe_wdl, root_moves
 from Piece_data import PIECE_VALUES, shield_bonus, PHASE_WEIGHTS, pst_dict, end_game_pst_dict, KING_PST, QUEEN_PST, ROOK_PST, BISHOP_PST, KNIGHT_PST, PAWN_PST
+from Piece_data import PHASE_MAX, piece_index, tapered_tables
 
 REDUCED_PENALTY = 5
 FULL_PENALTY = 10
-EXACT = 0
-LOWERBOUND = -1
-UPPERBOUND = 1
+LINE_THREAT_EXTRA = 0.5          # rooks and queens on the line cost this much more
+KING_CASTLED_BONUS = 5
+KING_SHIELD_BONUS = 15           # per shield pawn, centred on 1.5 pawns
+KING_CENTRALITY_PENALTY = 2      # per file away from the middle of the board
+KING_OPEN_SQUARE_PENALTY = 25    # per empty square next to the king
+KING_HEAVY_NEIGHBOUR = 2
+KING_MINOR_NEIGHBOUR = 3
+KING_PAWN_NEIGHBOUR = 7
 Flag = 0
+TT_SIZE_MB = 32
+THREADS = 1
+PAWN_HASH_SIZE_MB = 2
+DEFAULT_DEPTH = 4
+MAX_DEPTH = 64
+MOVES_TO_GO = 30
+SOFT_TIME_FRACTION = 0.5
+MATE_SCORE = 32000
+QUIESCENCE_DEPTH = 6
+DELTA_MARGIN = 200
+MAX_PLY = 128
+SEE_PRUNE_DEPTH = 2
+SEE_QUIET_MARGIN = 80
+# tablebase wins rank below any mate the search finds itself
+TB_WIN_SCORE = MATE_SCORE - 2 * MAX_PLY
+ASPIRATION_DEPTH = 3
+ASPIRATION_WINDOW = 50
+ASPIRATION_MAX = 800
+# Each pruning rule can be switched off on its own, e.g. to measure what it buys.
+LMR = True
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+LMR_LATE_MOVES = 8      # moves searched before the reduction grows to 2 plies
+FUTILITY = True
+FUTILITY_MARGINS = [0, 150, 300]          # by remaining depth
+REVERSE_FUTILITY = True
+REVERSE_FUTILITY_MARGIN = 120             # per ply of remaining depth
+HISTORY_LIMIT = 1 << 20
+CHECK_INCREMENTAL = False
+EVAL_TOLERANCE = 1e-6
+# weights of the terms in eval()
+MATERIAL_WEIGHT = 0.7
+PST_WEIGHT = 0.4
+PAWN_STRUCTURE_WEIGHT = 0.25
+ROOK_STRUCTURE_WEIGHT = 0.2
+KING_SAFETY_WEIGHT = 0.4
+MOBILITY_WEIGHT = 0.3
+END_GAME_MOBILITY_WEIGHT = 0.3
+BOOK_FILE = "book.bin"           # Polyglot book, skipped when the file isn't there
+BOOK_MAX_PLY = 20
+BOOK_SELECTION = "weighted"      # or "best"
+SYZYGY_PATH = None               # Syzygy table directories, separated like PATH
+TT_FILE = None                   # transposition table snapshot used by load_tt/save_tt
+NNUE_FILE = None                 # network weights (nnue.py) evaluating instead of the hand-written eval
+PARAMS_FILE = "eval_params.json" # tuned evaluation parameters (texel.py), loaded at import when present
 
 
-TT = {}
+TT = TranspositionTable(TT_SIZE_MB)
+PAWN_TT = PawnHashTable(PAWN_HASH_SIZE_MB)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchState:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.reset()
+
+    def reset(self, time_limit=None, node_limit=None):
+        self.nodes = 0
+        self.qnodes = 0
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def check(self):
+        if self.stop_event.is_set() or (self.deadline is not None and time.perf_counter() >= self.deadline):
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes + self.qnodes >= self.node_limit:
+            raise SearchTimeout()
+
+
+SEARCH = SearchState()
+# SearchStats of the running search when statistics were asked for, else None
+STATS = None
+# Syzygy tables opened from SYZYGY_PATH, and the most pieces they cover
+TABLEBASE = None
+TB_PIECES = 0
+
+def load_tablebase():
+    global TABLEBASE, TB_PIECES
+    if SYZYGY_PATH:
+        TABLEBASE, TB_PIECES = open_tablebase(SYZYGY_PATH)
+    else:
+        TABLEBASE, TB_PIECES = None, 0
+
+# network opened from NNUE_FILE, or None for the classical evaluation
+NETWORK = None
+
+def load_network():
+    # the network brings its own accumulator, which make_move and unmake_move update
+    global NETWORK, ACCUMULATOR
+    if NNUE_FILE:
+        from nnue import open_network
+        network = open_network(NNUE_FILE)
+        if network is not NETWORK:
+            NETWORK, ACCUMULATOR = network, network.accumulator()
+    elif NETWORK is not None:
+        NETWORK, ACCUMULATOR = None, EvalAccumulator()
+
+def tablebase_score(wdl):
+    # wins and losses the 50-move rule would spoil count as draws
+    if wdl == 2:
+        return TB_WIN_SCORE
+    if wdl == -2:
+        return -TB_WIN_SCORE
+    return 0
+
+def stop_search():
+    SEARCH.stop_event.set()
+
+def ray_masks(dr, dc):
+    masks = []
+    for sq in chess.SQUARES:
+        mask = 0
+        row, col = chess.square_rank(sq) + dr, chess.square_file(sq) + dc
+        while 0 <= row < 8 and 0 <= col < 8:
+            mask |= chess.BB_SQUARES[row * 8 + col]
+            row += dr
+            col += dc
+        masks.append(mask)
+    return masks
+
+# (rays from every square, ray runs towards higher squares, diagonal)
+KING_RAYS = [(ray_masks(dr, dc), dr > 0 or (dr == 0 and dc > 0), dr != 0 and dc != 0)
+             for dr, dc in [(1,-1), (1,1), (-1, -1), (-1, 1), (1,0), (0, -1), (0, 1), (-1, 0)]]
+ROOK_RAYS = [ray for ray in KING_RAYS if not ray[2]]
+BB_CASTLED_SQUARES = [chess.BB_G8 | chess.BB_C8, chess.BB_G1 | chess.BB_C1]
+# king_safety_adj_fct looks for the pawn shield on rank 7 for white and rank 2 for black
+BB_KING_SHIELD = [[chess.BB_RANKS[6 if color == chess.WHITE else 1]
+                   & (chess.BB_FILES[chess.square_file(sq)]
+                      | chess.shift_left(chess.BB_FILES[chess.square_file(sq)])
+                      | chess.shift_right(chess.BB_FILES[chess.square_file(sq)]))
+                   for sq in chess.SQUARES] for color in (chess.BLACK, chess.WHITE)]
 
 def MVV_LVA(board, move):
     piece = board.piece_at(move.from_square)
@@ -20,373 +167,972 @@ def MVV_LVA(board, move):
     else:    
         target = board.piece_at(move.to_square)
         
-    return abs((PIECE_VALUES[target.piece_type] - PIECE_VALUES[piece.piece_type]) // 10)
-
-def order_moves(board):
-    moves = list(board.legal_moves)
-    def move_score(move):
-        score = 0
-        if board.is_castling(move):
-            score += 50
-        score += MVV_LVA(board, move) if board.is_capture(move) else 0
-        if board.gives_check(move):
-            score += 25
-        return score
-    moves.sort(key=move_score, reverse=True)
-    return moves
-
-def eval_mobility(board):
-    total = 0
-    for move in board.legal_moves:
-        piece = board.piece_at(move.from_square)
-        sign = 7 if piece and piece.color == chess.WHITE else -7
-        total += sign
-    return total
+    # negative when the capturing piece is worth more than its victim
+    return (PIECE_VALUES[target.piece_type] - PIECE_VALUES[piece.piece_type]) // 10
+
+# SEE needs a king value: it is never really captured, only stops a sequence.
+SEE_VALUES = dict(PIECE_VALUES)
+SEE_VALUES[chess.KING] = 20000
+
+def attackers_to(board, square, occupied):
+    # Both sides' attackers of square with only the pieces in occupied on the
+    # board, so sliders behind a piece that has already captured show up.
+    rank_file = (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied]
+                 | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    diagonal = chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    queens = board.queens
+    attackers = ((rank_file & (board.rooks | queens))
+                 | (diagonal & (board.bishops | queens))
+                 | (chess.BB_KNIGHT_ATTACKS[square] & board.knights)
+                 | (chess.BB_KING_ATTACKS[square] & board.kings)
+                 | (chess.BB_PAWN_ATTACKS[chess.WHITE][square] & board.pawns & board.occupied_co[chess.BLACK])
+                 | (chess.BB_PAWN_ATTACKS[chess.BLACK][square] & board.pawns & board.occupied_co[chess.WHITE]))
+    return attackers & occupied
+
+def see(board, move):
+    # Static exchange evaluation: material won by the side to move if it plays
+    # move and both sides keep recapturing on the target square with their
+    # least valuable attacker, each free to stop when that is better.
+    target = move.to_square
+    occupied = board.occupied & ~chess.BB_SQUARES[move.from_square]
+    if board.is_en_passant(move):
+        gain = SEE_VALUES[chess.PAWN]
+        occupied &= ~chess.BB_SQUARES[target - 8 if board.turn == chess.WHITE else target + 8]
+    else:
+        victim = board.piece_type_at(target)
+        gain = SEE_VALUES[victim] if victim else 0
+    on_target = board.piece_type_at(move.from_square)
+    if move.promotion:
+        gain += SEE_VALUES[move.promotion] - SEE_VALUES[chess.PAWN]
+        on_target = move.promotion
+
+    gains = [gain]
+    color = not board.turn
+    while True:
+        attackers = attackers_to(board, target, occupied)
+        own = attackers & board.occupied_co[color]
+        if not own:
+            break
+        for piece_type in chess.PIECE_TYPES:
+            candidates = own & board.pieces_mask(piece_type, color)
+            if candidates:
+                break
+        square = candidates & -candidates
+        if piece_type == chess.KING and attackers & board.occupied_co[not color] & ~square:
+            break
+        gains.append(SEE_VALUES[on_target] - gains[-1])
+        on_target = piece_type
+        occupied &= ~square
+        color = not color
+
+    while len(gains) > 1:
+        last = gains.pop()
+        gains[-1] = -max(-gains[-1], last)
+    return gains[0]
+
+def capture_score(board, move):
+    # A capture of a piece worth at least the capturer can't lose material,
+    # so MVV_LVA stands in for SEE there and SEE is only run on the rest.
+    score = MVV_LVA(board, move) * 10
+    return score if score >= 0 else see(board, move)
+
+def attack_mobility(board):
+    # Pseudo-legal mobility per side from attack bitboards, no move generation.
+    # Returns ([black, white] mobility, [black, white] safe king squares).
+    occupied = board.occupied
+    mobility = [0, 0]
+    attacked = [0, 0]
+    for color in chess.COLORS:
+        own = board.occupied_co[color]
+        for sq in chess.scan_reversed(own & ~board.pawns & ~board.kings):
+            attacks = board.attacks_mask(sq)
+            attacked[color] |= attacks
+            mobility[color] += chess.popcount(attacks & ~own)
+
+        pawns = board.pawns & own
+        if color == chess.WHITE:
+            pushes = chess.shift_up(pawns) & ~occupied
+            pawn_attacks = chess.shift_up_left(pawns) | chess.shift_up_right(pawns)
+        else:
+            pushes = chess.shift_down(pawns) & ~occupied
+            pawn_attacks = chess.shift_down_left(pawns) | chess.shift_down_right(pawns)
+        attacked[color] |= pawn_attacks
+        mobility[color] += chess.popcount(pushes) + chess.popcount(pawn_attacks & board.occupied_co[not color])
+
+        king = board.king(color)
+        if king is not None:
+            attacked[color] |= chess.BB_KING_ATTACKS[king]
+
+    king_mobility = [0, 0]
+    for color in chess.COLORS:
+        king = board.king(color)
+        if king is None:
+            continue
+        king_mobility[color] = chess.popcount(chess.BB_KING_ATTACKS[king] & ~board.occupied_co[color] & ~attacked[not color])
+        mobility[color] += king_mobility[color]
+    return mobility, king_mobility
+
+
+class MoveContext:
+    # Everything a node needs about its moves, generated once and shared by the
+    # terminal checks, move ordering and evaluation.
+    def __init__(self, board):
+        self.board = board
+        # only whether a legal move exists: the moves themselves are generated
+        # stage by stage by staged_moves
+        self.has_moves = any(board.generate_legal_moves())
+        self.in_check = board.is_check()
+        self._mobility = None
+
+    def is_checkmate(self):
+        return not self.has_moves and self.in_check
+
+    def is_stalemate(self):
+        return not self.has_moves and not self.in_check
+
+    def is_game_over(self):
+        return not self.has_moves or self.board.is_insufficient_material() or self.board.halfmove_clock >= 150
+
+    def mobility(self):
+        if self._mobility is None:
+            self._mobility = attack_mobility(self.board)
+        return self._mobility
+
+
+# Killer moves: two quiet moves per ply that recently caused a cutoff there.
+KILLERS = [[None, None] for _ in range(MAX_PLY)]
+# History: cutoff credit for quiet moves, indexed [color][from * 64 + to].
+HISTORY = [[0] * 4096, [0] * 4096]
+
+def clear_move_ordering():
+    for killers in KILLERS:
+        killers[0] = killers[1] = None
+    # keep some of the previous search's history, it still mostly applies
+    for table in HISTORY:
+        for i in range(4096):
+            table[i] >>= 1
+
+def store_killer(move, ply):
+    killers = KILLERS[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+
+def add_history(color, move, depth):
+    table = HISTORY[color]
+    index = move.from_square * 64 + move.to_square
+    table[index] += depth * depth
+    if table[index] > HISTORY_LIMIT:
+        for i in range(4096):
+            table[i] >>= 1
+
+def staged_moves(board, tt_move=None, ply=0):
+    # TT move, good captures and queen promotions, killers, quiets by history,
+    # then losing captures. Each stage is only generated once the moves before
+    # it have failed to cut off.
+    done = []
+    if tt_move is not None and board.is_legal(tt_move):
+        done.append(tt_move)
+        yield tt_move
+
+    captures = [move for move in board.generate_legal_captures() if move not in done]
+    scores = {move: capture_score(board, move) for move in captures}
+    captures.sort(key=scores.__getitem__, reverse=True)
+    bad_captures = []
+    for move in captures:
+        if scores[move] < 0:
+            bad_captures.append(move)
+        else:
+            yield move
+    for move in board.generate_legal_moves(board.pawns, chess.BB_BACKRANKS & ~board.occupied):
+        if move.promotion == chess.QUEEN and move not in done:
+            done.append(move)
+            yield move
+
+    for move in KILLERS[ply] if ply < MAX_PLY else ():
+        if move is not None and move not in done and not board.is_capture(move) and board.is_legal(move):
+            done.append(move)
+            yield move
+
+    history = HISTORY[board.turn]
+    quiets = [move for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not board.turn])
+              if not board.is_en_passant(move) and move not in done]
+    quiets.sort(key=lambda move: history[move.from_square * 64 + move.to_square], reverse=True)
+    yield from quiets
+
+    yield from bad_captures
+
+def order_moves(board, tt_move=None, ply=0):
+    return list(staged_moves(board, tt_move, ply))
+
+def eval_mobility(board, ctx=None):
+    mobility, _ = ctx.mobility() if ctx is not None else attack_mobility(board)
+    return (mobility[chess.WHITE] - mobility[chess.BLACK]) * 7
 
 def eval_king_safety(board):
     total = 0
-    for piece in [chess.KING]:
-        for color in [chess.WHITE, chess.BLACK]:
-            sign = 1 if color == chess.WHITE else - 1
-            king_sq = board.pieces(piece, color)
-            king_sq = next(iter(king_sq), None)
-            if king_sq is None:
-                continue
-            piece_obj = board.piece_at(king_sq)
-            square_set = chess.SquareSet(chess.BB_KING_ATTACKS[king_sq])
-            total += king_safety_adj_fct(board, sign, square_set, piece_obj)
+    for color in [chess.WHITE, chess.BLACK]:
+        sign = 1 if color == chess.WHITE else - 1
+        king_sq = board.king(color)
+        if king_sq is None:
+            continue
+        total += king_safety_adj_fct(board, sign, king_sq, color)
             
     return total
                     
-def king_safety_adj_fct(board, sign, square_set, piece):
+def king_safety_adj_fct(board, sign, king_sq, color):
     total = 0
-    castled_squares = [chess.G1, chess.C1] if piece.color == chess.WHITE else [chess.G8, chess.C8]
-    king_sq = board.king(piece.color)
-    if king_sq is None:
-        return 0
-    king_file = chess.square_file(king_sq)
-    centrality_penalty = abs(king_file - 3.5) * 2
-    if king_sq not in castled_squares:
+    own = board.occupied_co[color]
+    enemy = board.occupied_co[not color]
+
+    if BB_CASTLED_SQUARES[color] & chess.BB_SQUARES[king_sq]:
+        total += KING_CASTLED_BONUS * sign
+        shield_count = chess.popcount(BB_KING_SHIELD[color][king_sq] & board.pawns & own)
+        total += sign * KING_SHIELD_BONUS * (2 * shield_count - 3)
+    else:
+        centrality_penalty = abs(chess.square_file(king_sq) - 3.5) * KING_CENTRALITY_PENALTY
         total -= centrality_penalty * sign
-    
-    if king_sq in castled_squares:
-        total += 5 * sign
-        shield_rank = 6 if piece.color == chess.WHITE else 1
-        shield_files = [chess.square_file(king_sq) - 1, chess.square_file(king_sq), chess.square_file(king_sq) + 1]
-        shield_count = 0
-        for f in shield_files:
-            if 0 <= f < 8:
-                shield_piece = board.piece_at(chess.square(f, shield_rank))
-                if shield_piece and shield_piece.piece_type == chess.PAWN and shield_piece.color == piece.color:
-                    shield_count += 1
-        total += sign * 15 * (2 * shield_count - 3)
-
-      
-    for sq in square_set:
-        neighbour = board.piece_at(sq)
-        if not neighbour:
-            total -= 25 * sign
-            continue
-        
-        if neighbour.piece_type in [chess.ROOK, chess.QUEEN]:
-            value = 2
-        elif neighbour.piece_type in [chess.KNIGHT, chess.BISHOP]:
-            value = 3
-        elif neighbour.piece_type == chess.PAWN:
-            value = 7
-        else:   
-            continue
 
-        if neighbour.color == piece.color:
-            total += value * sign
-        else:
-            total -= value * sign
-    total += king_safety_long_threat_fct(board, sign, king_sq, piece)
+    neighbours = chess.BB_KING_ATTACKS[king_sq]
+    heavy = neighbours & (board.rooks | board.queens)
+    minor = neighbours & (board.knights | board.bishops)
+    pawns = neighbours & board.pawns
+    total -= KING_OPEN_SQUARE_PENALTY * sign * chess.popcount(neighbours & ~board.occupied)
+    total += KING_HEAVY_NEIGHBOUR * sign * (chess.popcount(heavy & own) - chess.popcount(heavy & enemy))
+    total += KING_MINOR_NEIGHBOUR * sign * (chess.popcount(minor & own) - chess.popcount(minor & enemy))
+    total += KING_PAWN_NEIGHBOUR * sign * (chess.popcount(pawns & own) - chess.popcount(pawns & enemy))
+
+    total += king_safety_long_threat_fct(board, sign, king_sq, color)
     return total
 
-        
+def first_on_ray(ray, forward):
+    return chess.lsb(ray) if forward else chess.msb(ray)
 
-def king_safety_long_threat_fct(board, sign, king_sq, piece):   
-    total = 0 
-    row, col = divmod(king_sq, 8)
-    directions = [(1,-1), (1,1), (-1, -1), (-1, 1), (1,0), (0, -1), (0, 1), (-1, 0)]
-    for dr, dc in directions:
-        distance = 0
-        piece_on_ray = None
-        target = (row + dr, col + dc)
-        target_r, target_c = target
-        square = target_r * 8 + target_c
-        while 0<=target_r<8 and 0<=target_c<8:
-            square = target_r * 8 + target_c
-            if board.piece_at(square):
-                piece_on_ray = board.piece_at(square)
-                break
-            target_r += dr
-            target_c += dc
-        if piece_on_ray:
-            
-            distance = max(abs(target_r - row), abs(target_c - col))
-            if distance == 1:
+def king_safety_long_threat_fct(board, sign, king_sq, color):
+    total = 0
+    occupied = board.occupied
+    own = board.occupied_co[color]
+    diagonal_attackers = board.bishops | board.queens
+    line_attackers = board.rooks | board.queens
+    for rays, forward, diagonal in KING_RAYS:
+        blockers = rays[king_sq] & occupied
+        if not blockers:
+            continue
+        square = first_on_ray(blockers, forward)
+        if chess.square_distance(king_sq, square) == 1:
+            continue
+
+        if chess.BB_SQUARES[square] & own:
+            # own piece shields the king, but look for a slider pinned behind it
+            total += shield_bonus.get(board.piece_type_at(square), 0) * sign
+            blockers = rays[square] & occupied
+            if not blockers:
                 continue
-            
-            if piece_on_ray.color == piece.color:
-                total+= shield_bonus.get(piece_on_ray.piece_type, 0) * sign
-                target_r += dr
-                target_c += dc
-                
-                while 0<=target_r<8 and 0<=target_c<8:
-                    square = target_r * 8 + target_c
-                    shield_ray_piece = board.piece_at(square)
-                    if shield_ray_piece:
-                        if shield_ray_piece.color != piece.color:
-                            if abs(dr) == abs(dc) and shield_ray_piece.piece_type in [chess.BISHOP, chess.QUEEN]:
-                                total -= REDUCED_PENALTY * sign
-                            elif shield_ray_piece.piece_type in [chess.QUEEN, chess.ROOK]:
-                                total -= (REDUCED_PENALTY + 0.5) * sign
-                        break
-                    target_r += dr
-                    target_c += dc
-            else:
-                if abs(dr) == abs(dc) and piece_on_ray.piece_type in [chess.BISHOP, chess.QUEEN]:
-                    total -= FULL_PENALTY * sign
-                elif piece_on_ray.piece_type in [chess.ROOK, chess.QUEEN]:
-                    total -= (FULL_PENALTY + 0.5) * sign
+            square = first_on_ray(blockers, forward)
+            if chess.BB_SQUARES[square] & own:
+                continue
+            penalty = REDUCED_PENALTY
+        else:
+            penalty = FULL_PENALTY
+
+        bb = chess.BB_SQUARES[square]
+        if diagonal and bb & diagonal_attackers:
+            total -= penalty * sign
+        elif bb & line_attackers:
+            total -= (penalty + LINE_THREAT_EXTRA) * sign
 
     return total
 
 def game_phase(board):
     phase = 0
     for piece, weight in PHASE_WEIGHTS.items():
-        phase += weight * (len(board.pieces(piece, chess.WHITE))) + (len(board.pieces(piece, chess.BLACK)))
+        phase += weight * chess.popcount(board.pieces_mask(piece, chess.WHITE) | board.pieces_mask(piece, chess.BLACK))
     return phase
 
-def eval_end_game_mobility(board):
+def eval_end_game_mobility(board, ctx=None):
+    _, king_mobility = ctx.mobility() if ctx is not None else attack_mobility(board)
     total = 0
     for color in [chess.WHITE, chess.BLACK]:
         sign = 1 if color == chess.WHITE else - 1
-        enemy_color = not color
-        king_squares = board.pieces(chess.KING, enemy_color)
-        enemy_king_sq = next(iter(king_squares), None)
-        mobility_count = sum(1 for move in board.legal_moves if move.from_square == enemy_king_sq)
-        total -= mobility_count * 40 * sign
+        total -= king_mobility[not color] * 40 * sign
 
     return total
         
 def eval_rook_structure(board):
     total = 0
-    directions = [(1,0), (0, -1), (0, 1), (-1, 0)]
     for color in [chess.WHITE, chess.BLACK]:
-        king_sq = board.pieces(chess.KING, color)
-        if not king_sq:
+        own = board.occupied_co[color]
+        if not board.kings & own:
             continue
         sign = 1 if color == chess.WHITE else - 1
-        rook_square = board.pieces(chess.ROOK, color)
-        if not rook_square:
-            continue
-        for sq in rook_square:
-            row, col = divmod(sq, 8)
-            for dr, dc in directions:
-                found = False
-                target = (row + dr, col + dc)
-                target_r, target_c = target
-                square = target_r * 8 + target_c
-                while 0<=target_r<8 and 0<=target_c<8:
-                    square = target_r * 8 + target_c
-                    piece = board.piece_at(square)
-                    if piece and piece.color != color:
-                        found = True
-                        total += 30 * sign if piece.piece_type != chess.KING else (60 * sign)
-                        break
-                    elif piece and piece.piece_type == chess.PAWN and piece.color == color:
-                        found = True
-                        total -= 30 * sign
-                        break
-                    target_r += dr
-                    target_c += dc
-                if not found:
+        enemy = board.occupied_co[not color]
+        # own pieces other than pawns are looked through
+        targets = enemy | (board.pawns & own)
+        for sq in chess.scan_reversed(board.rooks & own):
+            for rays, forward, _ in ROOK_RAYS:
+                blockers = rays[sq] & targets
+                if not blockers:
                     total += 15 * sign
+                    continue
+                bb = chess.BB_SQUARES[first_on_ray(blockers, forward)]
+                if bb & enemy:
+                    total += 60 * sign if bb & board.kings else 30 * sign
+                else:
+                    total -= 30 * sign
     return total
 
             
 def eval_pawn_structure(board):
-    total = 0
-    white_doubled = [0] * 8
-    black_doubled = [0] * 8
-    
-    for color in [chess.WHITE, chess.BLACK]:
-        sign = 1 if color == chess.WHITE else - 1
-        square_set = board.pieces(chess.PAWN, color)
-        for sq in square_set:
-            p_r = p_l = None 
-            square = sq if color == chess.WHITE else chess.square_mirror(sq)
-            row, col = divmod(square, 8)
-            if color == chess.WHITE:
-                white_doubled[col] += 1
-            else:
-                black_doubled[col] += 1
-            if 0 <= row < 8: 
-                if 0 < col < 7:
-                    adj_r = (row + 1) * 8 + (col + 1) if color == chess.WHITE else (row - 1) * 8 + (col + 1)
-                    p_r = board.piece_at(adj_r)
-                    adj_l = (row + 1) * 8 + (col - 1) if color == chess.WHITE else (row - 1) * 8 + (col - 1)
-                    p_l = board.piece_at(adj_l)
-                elif col == 0:
-                    adj_r = (row + 1) * 8 + (col + 1) if color == chess.WHITE else (row - 1) * 8 + (col + 1)
-                    p_r = board.piece_at(adj_r)
-                elif col == 7:
-                    adj_l = (row + 1) * 8 + (col - 1) if color == chess.WHITE else (row - 1) * 8 + (col - 1)
-                    p_l = board.piece_at(adj_l)
-                    
-            if (p_r and p_r.piece_type == chess.PAWN) or (p_l and p_l.piece_type == chess.PAWN):
-                total += 30 * sign 
-                
-        for file in range(8):
-            if sign == 1:
-                total -= (white_doubled[file] - 1) * 30 
-            else:
-                total += (black_doubled[file] - 1) * 30
-                
+    pawns = board.pawns
+    white_pawns = pawns & board.occupied_co[chess.WHITE]
+    black_pawns = pawns & board.occupied_co[chess.BLACK]
+
+    # white pawns with any pawn on a square they attack
+    white_support = white_pawns & (((pawns >> 9) & ~chess.BB_FILE_H) | ((pawns >> 7) & ~chess.BB_FILE_A))
+    # black pawns are checked from their mirrored square, one rank towards rank 1
+    black_targets = chess.flip_vertical(black_pawns) >> 8
+    black_support = black_targets & (((pawns >> 1) & ~chess.BB_FILE_H) | ((pawns << 1) & ~chess.BB_FILE_A & chess.BB_ALL))
+
+    total = 30 * (chess.popcount(white_support) - chess.popcount(black_support))
+    # per-file pawn counts: -30 * (count - 1) for white, mirrored for black
+    total += 30 * (chess.popcount(black_pawns) - chess.popcount(white_pawns))
     return total
 
-def eval_material(board):
-    total = 0
-    for piece in [chess.KNIGHT, chess.ROOK, chess.QUEEN, chess.KING, chess.BISHOP, chess.PAWN]:
-        for color in [chess.WHITE, chess.BLACK]:
-            sign = 1 if color == chess.WHITE else - 1
-            total += len(board.pieces(piece, color)) * PIECE_VALUES[piece] * sign
-    return total 
-        
-    
-def eval_pst(board):
-    total = 0
+def probe_pawn_structure(board):
+    white_pawns = board.pawns & board.occupied_co[chess.WHITE]
+    black_pawns = board.pawns & board.occupied_co[chess.BLACK]
+    score = PAWN_TT.probe(white_pawns, black_pawns)
+    if score is None:
+        score = eval_pawn_structure(board)
+        PAWN_TT.store(white_pawns, black_pawns, score)
+    return score
 
-    phase = game_phase(board)
-    for color in [chess.WHITE, chess.BLACK]:
-        sign = 1 if color == chess.WHITE else - 1
-        for piece in [chess.PAWN, chess.BISHOP, chess.KNIGHT, chess.ROOK, chess.QUEEN, chess.KING]:
-            square_set = board.pieces(piece, color)
-            for sq in square_set:
-                idx = chess.square_mirror(sq) if color == chess.BLACK else sq
-                pst = pst_dict[piece] if phase > 20 else end_game_pst_dict[piece]
-                total += pst[idx] * sign
+def eval_tables(board):
+    # middlegame and endgame sums of the combined material + PST tables
+    mg = eg = 0.0
+    for color in chess.COLORS:
+        for piece in chess.PIECE_TYPES:
+            base = piece_index(color, piece) * 64
+            for sq in chess.scan_forward(board.pieces_mask(piece, color)):
+                mg += MG_TABLE[base + sq]
+                eg += EG_TABLE[base + sq]
+    return mg, eg
 
-    return total
+def taper(mg, eg, phase):
+    phase = min(phase, PHASE_MAX)
+    return (mg * phase + eg * (PHASE_MAX - phase)) / PHASE_MAX
+
+def eval_material_pst(board, phase=None):
+    if phase is None:
+        phase = game_phase(board)
+    mg, eg = eval_tables(board)
+    return taper(mg, eg, phase)
+
+def eval(board, ctx=None, acc=None):
+    if NETWORK is not None:
+        if acc is not None and CHECK_INCREMENTAL:
+            acc.verify(board)
+        return NETWORK.evaluate(board, acc) * perspective(board)
 
-def eval(board):
     total = 0
-    phase = game_phase(board)
+    if acc is not None:
+        if CHECK_INCREMENTAL:
+            acc.verify(board)
+        phase = acc.phase
+        material_pst = taper(acc.mg, acc.eg, phase)
+    else:
+        phase = game_phase(board)
+        material_pst = eval_material_pst(board, phase)
     phase_norm = phase / 24.0
 
-    pawn_structure = eval_pawn_structure(board) * (1 + 0.3*(1 - phase_norm))
-    material = eval_material(board) * (1 - 0.65 * (1 - phase_norm))
+    pawn_structure = probe_pawn_structure(board) * (1 + 0.3*(1 - phase_norm))
     king_safety = eval_king_safety(board) * (1 - 0.5*(1 - phase_norm))
     rook_structure = eval_rook_structure(board) * (1 + 0.7 * (1 - phase_norm))
-    pst = eval_pst(board) * (1.15 + (1 - phase_norm))
-    end_game_mobility = eval_end_game_mobility(board)
-    mobility = eval_mobility(board) * phase_norm + end_game_mobility * (1-phase_norm)
-    total = material * 0.7 + pst * 0.4 + pawn_structure * 0.25 + rook_structure * 0.2 + king_safety * 0.4 + mobility * 0.3 + end_game_mobility * 0.3
+    end_game_mobility = eval_end_game_mobility(board, ctx)
+    mobility = eval_mobility(board, ctx) * phase_norm + end_game_mobility * (1-phase_norm)
+    # MATERIAL_WEIGHT and PST_WEIGHT are folded into the tables behind material_pst
+    total = (material_pst + pawn_structure * PAWN_STRUCTURE_WEIGHT
+             + rook_structure * ROOK_STRUCTURE_WEIGHT + king_safety * KING_SAFETY_WEIGHT
+             + mobility * MOBILITY_WEIGHT + end_game_mobility * END_GAME_MOBILITY_WEIGHT)
     return total
 
 
-def alphabeta(board, depth, alpha, beta, is_maximizing):
-    current_hash = board._transposition_key()
-    mate_score = 32000
-    original_alpha = alpha
-    original_beta = beta
-    value = -float('inf') if is_maximizing else float('inf')
-    
-    if depth == 0 or board.is_game_over():
-        if board.is_checkmate():
-            return -mate_score + depth if board.turn == chess.WHITE else mate_score - depth
-        return eval(board)
-    
-    if current_hash in TT:
-        entry = TT[current_hash]
-        if entry["depth"] >= depth:
-            if entry["Flag"] == EXACT:
-                return entry["value"]
-            elif entry["Flag"] == LOWERBOUND:
-                beta = min(beta, entry["value"])
-            elif entry["Flag"] == UPPERBOUND:
-                alpha = max(alpha, entry["value"])
+# Everything a stored score depends on. A TT snapshot is tagged with a hash of
+# it, so editing the evaluation invalidates snapshots written before the edit.
+EVAL_FUNCTIONS = [eval, eval_tables, taper, eval_material_pst, game_phase, eval_pawn_structure, eval_king_safety,
+                  king_safety_adj_fct, king_safety_long_threat_fct, first_on_ray, eval_rook_structure,
+                  eval_mobility, eval_end_game_mobility, attack_mobility]
+EVAL_TABLES = [PIECE_VALUES, shield_bonus, PHASE_WEIGHTS, pst_dict, end_game_pst_dict]
+EVAL_CONSTANTS = ["REDUCED_PENALTY", "FULL_PENALTY", "LINE_THREAT_EXTRA", "KING_CASTLED_BONUS", "KING_SHIELD_BONUS",
+                  "KING_CENTRALITY_PENALTY", "KING_OPEN_SQUARE_PENALTY", "KING_HEAVY_NEIGHBOUR", "KING_MINOR_NEIGHBOUR",
+                  "KING_PAWN_NEIGHBOUR", "MATE_SCORE", "TB_WIN_SCORE", "MATERIAL_WEIGHT", "PST_WEIGHT",
+                  "PAWN_STRUCTURE_WEIGHT", "ROOK_STRUCTURE_WEIGHT", "KING_SAFETY_WEIGHT", "MOBILITY_WEIGHT",
+                  "END_GAME_MOBILITY_WEIGHT"]
+
+def code_fingerprint(code):
+    parts = [code.co_code]
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            parts.append(code_fingerprint(const))
+        elif isinstance(const, frozenset):
+            # set order depends on the string hash seed
+            parts.append(repr(sorted(const, key=repr)).encode())
+        else:
+            parts.append(repr(const).encode())
+    return b"|".join(parts)
+
+def eval_signature():
+    digest = hashlib.sha1()
+    for table in EVAL_TABLES:
+        digest.update(repr(table).encode())
+    for name in EVAL_CONSTANTS:
+        digest.update(repr(globals()[name]).encode())
+    digest.update(MG_TABLE.tobytes())
+    digest.update(EG_TABLE.tobytes())
+    if NETWORK is not None:
+        digest.update(NETWORK.digest())
+    for function in EVAL_FUNCTIONS:
+        digest.update(code_fingerprint(function.__code__))
+    return int.from_bytes(digest.digest()[:8], "little")
+
+def save_tt(path=None):
+    load_network()
+    TT.save(path or TT_FILE, eval_signature())
+
+def load_tt(path=None):
+    # False when there is no snapshot or it was written for another evaluation
+    path = path or TT_FILE
+    load_network()
+    return bool(path) and os.path.exists(path) and TT.load(path, eval_signature())
+
+
+# Combined material + PST tables for the current MATERIAL_WEIGHT and PST_WEIGHT;
+# call build_eval_tables again after changing either.
+MG_TABLE = EG_TABLE = None
+
+def build_eval_tables():
+    global MG_TABLE, EG_TABLE
+    MG_TABLE, EG_TABLE = tapered_tables(MATERIAL_WEIGHT, PST_WEIGHT)
+
+# Parameter files name constants as in EVAL_CONSTANTS and tables by piece name.
+# Tables are changed in place, so every module holding them sees the new values.
+def load_params(path=None):
+    path = path or PARAMS_FILE
+    if not path or not os.path.exists(path):
+        return False
+    with open(path) as f:
+        params = json.load(f)
+    for name, value in params.get("constants", {}).items():
+        if name not in EVAL_CONSTANTS:
+            raise ValueError(f"{path}: unknown evaluation constant {name}")
+        globals()[name] = value
+    for table, target in (("piece_values", PIECE_VALUES), ("shield_bonus", shield_bonus)):
+        for piece, value in params.get(table, {}).items():
+            target[chess.PIECE_NAMES.index(piece)] = value
+    for table, target in (("pst", pst_dict), ("end_game_pst", end_game_pst_dict)):
+        for piece, values in params.get(table, {}).items():
+            target[chess.PIECE_NAMES.index(piece)][:] = values
+    for piece, value in PIECE_VALUES.items():
+        if piece != chess.KING:
+            SEE_VALUES[piece] = value
+    build_eval_tables()
+    return True
+
+build_eval_tables()
+load_params()
+
+# game phase contribution per piece, indexed [color][piece_type]
+PHASE_DELTA = [[0] * 7 for _ in chess.COLORS]
+for _color in chess.COLORS:
+    for _piece in PHASE_WEIGHTS:
+        PHASE_DELTA[_color][_piece] = PHASE_WEIGHTS[_piece]
+
+
+class EvalAccumulator:
+    # Middlegame/endgame material + PST sums and game phase, kept up to date by
+    # table lookups as the search makes and unmakes moves.
+    def __init__(self, board=None):
+        self.mg = self.eg = 0.0
+        self.phase = 0
+        self.stack = []
+        if board is not None:
+            self.reset(board)
+
+    def reset(self, board):
+        self.mg, self.eg, self.phase = self.recompute(board)
+        self.stack = []
+
+    @staticmethod
+    def recompute(board):
+        mg, eg = eval_tables(board)
+        return mg, eg, game_phase(board)
+
+    def push(self, changes):
+        self.stack.append((self.mg, self.eg, self.phase))
+        for color, piece, sq, delta in changes:
+            i = piece_index(color, piece) * 64 + sq
+            self.mg += MG_TABLE[i] * delta
+            self.eg += EG_TABLE[i] * delta
+            self.phase += PHASE_DELTA[color][piece] * delta
+
+    def push_null(self):
+        self.stack.append((self.mg, self.eg, self.phase))
+
+    def pop(self):
+        self.mg, self.eg, self.phase = self.stack.pop()
+
+    def verify(self, board):
+        # the sums are floats, so the order of additions shows in the last bits
+        mg, eg, phase = self.recompute(board)
+        if phase != self.phase or abs(mg - self.mg) > EVAL_TOLERANCE or abs(eg - self.eg) > EVAL_TOLERANCE:
+            raise AssertionError(f"incremental eval {(self.mg, self.eg, self.phase)} != full recompute "
+                                 f"{(mg, eg, phase)} in {board.fen()}")
+
+
+ACCUMULATOR = EvalAccumulator()
+
+def make_move(board, move, key):
+    changes = move_changes(board, move)
+    ACCUMULATOR.push(changes)
+    return push_move(board, move, key, changes)
+
+def make_null_move(board, key):
+    ACCUMULATOR.push_null()
+    return push_null(board, key)
+
+def unmake_move(board):
+    board.pop()
+    ACCUMULATOR.pop()
+
+
+def quiescence_moves(board):
+    # captures that lose material on the exchange are not worth searching here
+    scores = {move: capture_score(board, move) for move in board.generate_legal_captures()
+              if move.promotion in (None, chess.QUEEN)}
+    captures = [move for move in scores if scores[move] >= 0]
+    captures.sort(key=scores.__getitem__, reverse=True)
+    promotions = [move for move in board.generate_legal_moves(board.pawns, chess.BB_BACKRANKS & ~board.occupied)
+                  if move.promotion == chess.QUEEN]
+    return captures + promotions
+
+def capture_gain(board, move):
+    gain = 0
+    if board.is_en_passant(move):
+        gain = PIECE_VALUES[chess.PAWN]
+    else:
+        target = board.piece_type_at(move.to_square)
+        if target:
+            gain = PIECE_VALUES[target]
+    if move.promotion:
+        gain += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+    return gain
+
+def perspective(board):
+    # eval is from white's point of view, the search from the side to move's
+    return 1 if board.turn == chess.WHITE else -1
+
+def score_to_tt(score, ply):
+    # mate scores count plies from the root; the TT keeps them relative to the
+    # node so an entry is still right when reached at a different ply
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+def quiescence(board, alpha, beta, qdepth, ply=0):
+    SEARCH.qnodes += 1
+    SEARCH.check()
+
+    if board.is_check():
+        # no stand-pat while in check: every evasion is searched
+        moves = list(board.legal_moves)
+        if not moves:
+            return -MATE_SCORE + ply
+        if qdepth <= 0:
+            return eval(board, acc=ACCUMULATOR) * perspective(board)
+        stand_pat = None
+        value = -float('inf')
+    else:
+        stand_pat = eval(board, acc=ACCUMULATOR) * perspective(board)
+        if qdepth <= 0 or stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        value = stand_pat
+        moves = quiescence_moves(board)
+
+    for move in moves:
+        # delta pruning: even winning this piece can't bring the score back into the window
+        if stand_pat is not None and stand_pat + capture_gain(board, move) + DELTA_MARGIN < alpha:
+            continue
+
+        ACCUMULATOR.push(move_changes(board, move))
+        board.push(move)
+        score = -quiescence(board, -beta, -alpha, qdepth - 1, ply + 1)
+        unmake_move(board)
+
+        value = max(value, score)
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            if STATS is not None:
+                STATS.qcutoffs += 1
+            break
+
+    return value
+
+def negamax(board, key, depth, alpha, beta, ply):
+    if depth <= 0:
+        return quiescence(board, alpha, beta, QUIESCENCE_DEPTH, ply)
+    SEARCH.nodes += 1
+    SEARCH.check()
+    if STATS is not None:
+        STATS.depth_nodes[depth] = STATS.depth_nodes.get(depth, 0) + 1
+
+    ctx = MoveContext(board)
+    if ctx.is_game_over():
+        if ctx.is_checkmate():
+            return -MATE_SCORE + ply
+        return 0
+
+    tt_move = None
+    entry = TT.probe(key)
+    if entry is not None:
+        tt_depth, tt_value, tt_flag, tt_move = entry
+        tt_value = score_from_tt(tt_value, ply)
+        if tt_depth >= depth:
+            if tt_flag == EXACT:
+                return tt_value
+            elif tt_flag == LOWERBOUND:
+                alpha = max(alpha, tt_value)
+            elif tt_flag == UPPERBOUND:
+                beta = min(beta, tt_value)
             if alpha >= beta:
-                return entry["value"]
-    
-    if not board.is_check() and depth >= 3:
-        board.push(chess.Move.null())
-        current_hash = board._transposition_key()
-        score = alphabeta(board, depth - 3, alpha, beta, not is_maximizing)
-        board.pop()
-        if (is_maximizing and score >= beta) or (not is_maximizing and score <= alpha):
+                return tt_value
+
+    if TABLEBASE is not None and chess.popcount(board.occupied) <= TB_PIECES:
+        wdl = probe_wdl(TABLEBASE, board)
+        if wdl is not None:
+            if STATS is not None:
+                STATS.tb_hits += 1
+            value = tablebase_score(wdl)
+            # exact at any depth, so later visits stop at the TT probe
+            TT.store(key, MAX_PLY, value, EXACT, tt_move)
+            return value
+
+    original_alpha = alpha
+    pv_node = beta - alpha > 1
+
+    static_eval = None
+    if not ctx.in_check and not pv_node and depth < len(FUTILITY_MARGINS) and abs(beta) < MATE_SCORE - MAX_PLY:
+        static_eval = eval(board, ctx, ACCUMULATOR) * perspective(board)
+        # reverse futility: so far above beta that a shallow search won't bring it back
+        if REVERSE_FUTILITY and static_eval - REVERSE_FUTILITY_MARGIN * depth >= beta:
+            if STATS is not None:
+                STATS.reverse_futility_prunes += 1
+            return static_eval
+    # futility: quiet moves can't lift a hopeless static eval up to alpha
+    futile = FUTILITY and static_eval is not None and static_eval + FUTILITY_MARGINS[depth] <= alpha
+
+    if not ctx.in_check and depth >= 3:
+        if STATS is not None:
+            STATS.null_move_tries += 1
+        null_key = make_null_move(board, key)
+        score = -negamax(board, null_key, depth - 3, -beta, -beta + 1, ply + 1)
+        unmake_move(board)
+        if score >= beta:
+            if STATS is not None:
+                STATS.null_move_prunes += 1
             return score
-        
-    for move in order_moves(board):
-        board.push(move)
-        if board.is_repetition() or board.is_stalemate() or board.is_insufficient_material():
+
+    value = -float('inf')
+    best_move = None
+    searched = 0
+    for move in staged_moves(board, tt_move, ply):
+        # near the leaves, skip quiet moves that simply hang material
+        quiet = not move.promotion and not board.is_capture(move)
+        if (searched and quiet and depth <= SEE_PRUNE_DEPTH and not ctx.in_check
+                and see(board, move) < -SEE_QUIET_MARGIN * depth):
+            if STATS is not None:
+                STATS.see_prunes += 1
+            continue
+        child_key = make_move(board, move, key)
+        gives_check = board.is_check()
+        if searched and quiet and futile and not gives_check:
+            unmake_move(board)
+            if STATS is not None:
+                STATS.futility_prunes += 1
+            continue
+
+        if board.is_repetition() or board.is_insufficient_material():
             score = 0
+        elif not searched:
+            score = -negamax(board, child_key, depth - 1, -beta, -alpha, ply + 1)
         else:
-            score = alphabeta(board, depth - 1, alpha, beta, not is_maximizing)
-            
-        if is_maximizing:
-            value = max(value, score)
-            alpha = max(alpha, value)
-        else:
-            value = min(value, score)
-            beta = min(beta, value)
-            
-        board.pop()
-        if beta<=alpha:
+            reduction = 0
+            # late move reductions: well-ordered late quiets rarely matter, so
+            # search them shallower and only go full depth if one beats alpha
+            if (LMR and quiet and depth >= LMR_MIN_DEPTH and searched >= LMR_MIN_MOVES
+                    and not ctx.in_check and not gives_check and move not in KILLERS[ply]):
+                reduction = 2 if searched >= LMR_LATE_MOVES and depth > 3 else 1
+                if STATS is not None:
+                    STATS.lmr_reductions += 1
+            # principal variation search: a null window only has to show the
+            # move is no better than alpha; re-search the rare ones that are
+            score = -negamax(board, child_key, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+            if reduction and score > alpha:
+                if STATS is not None:
+                    STATS.lmr_researches += 1
+                score = -negamax(board, child_key, depth - 1, -alpha - 1, -alpha, ply + 1)
+            if alpha < score < beta:
+                score = -negamax(board, child_key, depth - 1, -beta, -alpha, ply + 1)
+        unmake_move(board)
+        searched += 1
+
+        if score > value:
+            value = score
+            best_move = move
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            if not board.is_capture(move) and not move.promotion:
+                store_killer(move, ply)
+                add_history(board.turn, move, depth)
+            if STATS is not None:
+                STATS.cutoffs += 1
+                if searched == 1:
+                    STATS.first_move_cutoffs += 1
             break
-            
-    
-    if value >= original_beta:
-        Flag = LOWERBOUND
-    elif value <= original_alpha:
+
+    if value <= original_alpha:
         Flag = UPPERBOUND
+    elif value >= beta:
+        Flag = LOWERBOUND
     else:
         Flag = EXACT
-        
-    if current_hash not in TT or TT[current_hash]["depth"] < depth:
-        TT[current_hash] = {
-            "depth" : depth,
-            "value" : value,
-            "Flag" : Flag
-        }
+
+    TT.store(key, depth, score_to_tt(value, ply), Flag, best_move)
     return value
 
-def select_best_move(board, hash, depth):
-    is_maximizing = board.turn == chess.WHITE
+def alphabeta(board, key, depth, alpha, beta, is_maximizing, ply=1):
+    # white's-point-of-view entry into negamax for callers outside the search
+    if is_maximizing:
+        return negamax(board, key, depth, alpha, beta, ply)
+    return -negamax(board, key, depth, -beta, -alpha, ply)
+
+def search_root(board, key, depth, pv_move=None, alpha=-float('inf'), beta=float('inf')):
+    # scores here are from the side to move's point of view
+    original_alpha = alpha
     best_move = None
-    best_value = -float('inf') if is_maximizing else float('inf')
-    alpha = -float('inf')
-    beta = float('inf')
-    
-    for move in order_moves(board):
-        board.push(move)
-        score = alphabeta(board, depth - 1, -float('inf'), float('inf'), not is_maximizing)
-        board.pop()
-        
-        if is_maximizing:
-            if score > best_value:
-                best_value = score
-                best_move = move
-                alpha = max(alpha, score)
+    best_value = -float('inf')
+
+    if pv_move is None:
+        entry = TT.probe(key)
+        pv_move = entry[3] if entry is not None else None
+
+    for move in order_moves(board, pv_move):
+        child_key = make_move(board, move, key)
+        if best_move is None:
+            score = -negamax(board, child_key, depth - 1, -beta, -alpha, 1)
         else:
-            if score < best_value:
-                best_value = score
-                best_move = move
-                beta = min(beta, score)
-                
-        if beta <= alpha:
+            score = -negamax(board, child_key, depth - 1, -alpha - 1, -alpha, 1)
+            if alpha < score < beta:
+                score = -negamax(board, child_key, depth - 1, -beta, -alpha, 1)
+        unmake_move(board)
+
+        if best_move is None or score > best_value:
+            best_value = score
+            best_move = move
+        alpha = max(alpha, score)
+        if alpha >= beta:
             break
-        
+
+    if best_value <= original_alpha:
+        Flag = UPPERBOUND
+    elif best_value >= beta:
+        Flag = LOWERBOUND
+    else:
+        Flag = EXACT
+    TT.store(key, depth, best_value, Flag, best_move)
+    return best_move, best_value
+
+def aspiration_search(board, key, depth, pv_move=None, previous=None):
+    # Search a narrow window around the previous iteration's score, widening
+    # the side that fails until the score lands inside it.
+    if previous is None or depth < ASPIRATION_DEPTH or abs(previous) >= MATE_SCORE - MAX_PLY:
+        return search_root(board, key, depth, pv_move)
+    delta = ASPIRATION_WINDOW
+    alpha, beta = previous - delta, previous + delta
+    while True:
+        move, value = search_root(board, key, depth, pv_move, alpha, beta)
+        if alpha < value < beta:
+            return move, value
+        delta *= 2
+        if delta > ASPIRATION_MAX:
+            return search_root(board, key, depth, pv_move)
+        if value <= alpha:
+            alpha = value - delta
+        else:
+            beta = value + delta
+            pv_move = move
+
+def principal_variation(board, key, max_length=MAX_DEPTH):
+    # follow best moves stored in the TT from this position
+    board = board.copy()
+    pv = []
+    seen = set()
+    while len(pv) < max_length and key not in seen:
+        seen.add(key)
+        entry = TT.probe(key)
+        if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+            break
+        pv.append(entry[3])
+        key = push_move(board, entry[3], key)
+    return pv
+
+def allocate_time(clock, increment=0, moves_to_go=None):
+    budget = clock / (moves_to_go or MOVES_TO_GO) + increment * 0.8
+    return max(0.01, min(budget, clock * 0.5))
+
+def select_best_move(board, hash, depth, time_limit=None, on_iteration=None, node_limit=None):
+    if hash is None:
+        hash = zobrist_hash(board)
+    TT.new_search()
+    SEARCH.stop_event.clear()
+    SEARCH.reset(time_limit, node_limit)
+    load_network()
+    ACCUMULATOR.reset(board)
+    clear_move_ordering()
+    load_tablebase()
+    root_ply = len(board.move_stack)
+    sign = perspective(board)
+
+    best_move = None
+    best_value = None
+    for current_depth in range(1, depth + 1):
+        try:
+            move, value = aspiration_search(board, hash, current_depth, best_move, best_value)
+        except SearchTimeout:
+            while len(board.move_stack) > root_ply:
+                unmake_move(board)
+            break
+        if move is None:
+            # no legal moves at the root: nothing to search
+            break
+
+        best_move, best_value = move, value
+        elapsed = SEARCH.elapsed()
+        if STATS is not None:
+            STATS.end_iteration(current_depth, SEARCH.nodes, SEARCH.qnodes, elapsed)
+        if on_iteration is not None:
+            on_iteration(current_depth, best_value * sign, best_move, SEARCH.nodes, SEARCH.qnodes, elapsed)
+        # an iteration costs several times the previous one, so don't start one we can't finish
+        if time_limit is not None and elapsed >= time_limit * SOFT_TIME_FRACTION:
+            break
+
+    if best_move is None:
+        best_move = next(iter(order_moves(board)), None)
     return best_move
 
-def ai_move(board, hash, depth = 4):
-    return select_best_move(board,  hash, depth)
+# Globals swapped for timed wrappers while a search is profiled, so the
+# unprofiled search pays nothing for the hooks.
+PROFILED_TERMS = ["eval", "eval_tables", "eval_material_pst", "game_phase", "probe_pawn_structure",
+                  "eval_pawn_structure", "eval_king_safety", "eval_rook_structure", "eval_mobility",
+                  "eval_end_game_mobility", "staged_moves", "quiescence_moves"]
 
-def ai_play(board,hash):
-    if board.is_game_over():
+def profiled(name, function):
+    if inspect.isgeneratorfunction(function):
+        def generator_wrapper(*args, **kwargs):
+            # only the time spent producing items, not what the caller does between them
+            elapsed = 0.0
+            generator = function(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                # also when the caller stops early, on a cutoff
+                generator.close()
+                if STATS is not None:
+                    STATS.record_term(name, elapsed)
+        return generator_wrapper
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        STATS.record_term(name, time.perf_counter() - start)
+        return result
+    return wrapper
+
+def search_with_stats(board, hash, depth, time_limit=None, on_iteration=None, node_limit=None, profile_eval=True):
+    global STATS
+    stats = SearchStats(profile_eval)
+    originals = {name: globals()[name] for name in PROFILED_TERMS} if profile_eval else {}
+    tt_probes, tt_hits, tt_stores = TT.probes, TT.hits, TT.stores
+    STATS = stats
+    for name, function in originals.items():
+        globals()[name] = profiled(name, function)
+    try:
+        move = select_best_move(board, hash, depth, time_limit, on_iteration, node_limit)
+    finally:
+        globals().update(originals)
+        STATS = None
+
+    stats.nodes = SEARCH.nodes
+    stats.qnodes = SEARCH.qnodes
+    stats.time = SEARCH.elapsed()
+    stats.tt_probes = TT.probes - tt_probes
+    stats.tt_hits = TT.hits - tt_hits
+    stats.tt_stores = TT.stores - tt_stores
+    return move, stats
+
+def tablebase_move(board, on_iteration=None):
+    # with the position in the tables there's nothing to search
+    load_tablebase()
+    if TABLEBASE is None or chess.popcount(board.occupied) > TB_PIECES:
         return None
+    ranked = root_moves(TABLEBASE, board)
+    if not ranked:
+        return None
+    wdl, _, move = ranked[0]
+    if on_iteration is not None:
+        on_iteration(1, tablebase_score(wdl) * perspective(board), move, 0, 0, 0.0)
+    return move
+
+def ai_move(board, hash, depth=None, time_limit=None, clock=None, increment=0, workers=None, on_iteration=None,
+            node_limit=None, moves_to_go=None, use_book=True):
+    if clock is not None:
+        time_limit = allocate_time(clock, increment, moves_to_go)
+    if depth is None:
+        depth = MAX_DEPTH if time_limit is not None or node_limit is not None else DEFAULT_DEPTH
+    move = book_move(board, hash) if use_book else None
+    if move is None:
+        move = tablebase_move(board, on_iteration)
+    if move is not None:
+        return move
+    workers = THREADS if workers is None else workers
+    if workers > 1:
+        from parallel_search import get_parallel_search
+        return get_parallel_search(workers).select_best_move(board, hash, depth, time_limit, on_iteration, node_limit)
+    return select_best_move(board, hash, depth, time_limit, on_iteration, node_limit)
+
+def book_move(board, hash=None):
+    if not BOOK_FILE or board.ply() >= BOOK_MAX_PLY or not os.path.exists(BOOK_FILE):
+        return None
+    return open_book(BOOK_FILE).choose(board, hash, BOOK_SELECTION)
 
-    return ai_move(board, hash)
\ No newline at end of file
+def ai_play(board, hash, time_limit=None, clock=None, increment=0, on_iteration=None):
+    if board.is_game_over():
+        return None
+    return ai_move(board, hash, time_limit=time_limit, clock=clock, increment=increment, on_iteration=on_iteration)
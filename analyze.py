@@ -0,0 +1,172 @@
+import argparse, collections, json, multiprocessing, os, sys, time
+import chess, chess.pgn
+
+import ai_logic
+
+# Offline analysis of PGN/EPD archives. Input is streamed one game or EPD line
+# at a time, each unit is searched by a pool worker with its own transposition
+# table, and results are appended to a JSONL file in input order as soon as
+# they are ready. Every record carries the file offset of its unit, which is
+# what --resume restarts from.
+
+DEFAULT_DEPTH = 4
+DEFAULT_HASH_MB = 16
+PENDING_PER_WORKER = 4   # units queued ahead per worker before reading pauses
+
+
+def read_epd(path, start=0):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", "replace").strip()
+            if line and not line.startswith("#"):
+                yield offset, ("epd", line)
+
+def read_pgn(path, start=0):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        f.seek(start)
+        while True:
+            offset = f.tell()
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            yield offset, ("pgn", game.board().fen(), [move.uci() for move in game.mainline_moves()])
+
+def read_units(path, start=0):
+    return read_pgn(path, start) if path.lower().endswith(".pgn") else read_epd(path, start)
+
+
+def _init_worker(hash_mb):
+    ai_logic.TT.resize(hash_mb)
+
+def analyse_position(board, limits):
+    result = {}
+    def on_iteration(depth, score, move, nodes, qnodes, elapsed):
+        result["depth"] = depth
+        result["score"] = round(score, 1)
+    move = ai_logic.select_best_move(board, None, limits["depth"], limits["time"], on_iteration, limits["nodes"])
+    return {
+        "fen": board.fen(),
+        "best_move": move.uci() if move is not None else None,
+        "score": result.get("score"),
+        "depth": result.get("depth", 0),
+        "nodes": ai_logic.SEARCH.nodes + ai_logic.SEARCH.qnodes,
+        "time": round(ai_logic.SEARCH.elapsed(), 3),
+    }
+
+def _analyse_unit(task):
+    offset, unit, limits = task
+    records = []
+    try:
+        if unit[0] == "epd":
+            board, operations = chess.Board.from_epd(unit[1])
+            record = {"offset": offset}
+            if "id" in operations:
+                record["id"] = operations["id"]
+            if not board.is_game_over():
+                record.update(analyse_position(board, limits))
+                records.append(record)
+            return records
+
+        _, fen, moves = unit
+        board = chess.Board(fen)
+        for ply, uci in enumerate(moves):
+            move = chess.Move.from_uci(uci)
+            # one game shares the worker's table, so later positions start warm
+            record = {"offset": offset, "ply": ply, "played": uci}
+            record.update(analyse_position(board, limits))
+            records.append(record)
+            board.push(move)
+    except ValueError as exc:
+        # a malformed unit is recorded and passed over rather than ending the
+        # run, so a resume goes on past it too
+        records.append({"offset": offset, "error": str(exc)})
+    return records
+
+def resume_point(out_path):
+    # Where to restart reading and where to cut the output: the last unit in
+    # the file may have been cut short, so its records are dropped and redone.
+    if not os.path.exists(out_path):
+        return 0, 0
+    last_offset, unit_start, position = None, 0, 0
+    with open(out_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                offset = json.loads(line)["offset"]
+            except (ValueError, KeyError):
+                break
+            if offset != last_offset:
+                last_offset, unit_start = offset, position
+            position += len(line)
+    if last_offset is None:
+        return 0, 0
+    return last_offset, unit_start
+
+def run(path, out_path, limits, workers=None, hash_mb=DEFAULT_HASH_MB, start=0, resume=False, max_pending=None, out=None):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * PENDING_PER_WORKER
+    if resume:
+        start, keep = resume_point(out_path)
+        if os.path.exists(out_path):
+            with open(out_path, "r+b") as f:
+                f.truncate(keep)
+
+    positions = 0
+    begin = time.perf_counter()
+    # spawn for the same reason as parallel_search: no inherited locks
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(hash_mb,)) as pool, open(out_path, "a") as output:
+        pending = collections.deque()
+
+        def write_oldest():
+            nonlocal positions
+            records = pending.popleft().get()
+            output.write("".join(json.dumps(record) + "\n" for record in records))
+            output.flush()
+            positions += sum("error" not in record for record in records)
+
+        for offset, unit in read_units(path, start):
+            pending.append(pool.apply_async(_analyse_unit, ((offset, unit, limits),)))
+            # backpressure: don't read further ahead than the pool can use
+            while len(pending) >= max_pending:
+                write_oldest()
+                if out is not None and positions:
+                    elapsed = time.perf_counter() - begin
+                    out(f"{positions} positions  {positions / elapsed:.1f}/s  offset {offset}")
+        while pending:
+            write_oldest()
+
+    return positions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch analysis of PGN or EPD files")
+    parser.add_argument("input", help="a .pgn file, anything else is read as EPD")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--depth", type=int, help=f"search depth (default {DEFAULT_DEPTH} without other limits)")
+    parser.add_argument("--movetime", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="node budget per position")
+    parser.add_argument("--workers", type=int, help="pool size (default: all cores)")
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH_MB, help="transposition table MB per worker")
+    parser.add_argument("--start-offset", type=int, default=0, help="input offset to start from")
+    parser.add_argument("--resume", action="store_true", help="continue from where the output file stops")
+    parser.add_argument("--max-pending", type=int, help="units in flight before reading pauses")
+    args = parser.parse_args(argv)
+
+    depth = args.depth
+    if depth is None:
+        depth = ai_logic.MAX_DEPTH if args.movetime is not None or args.nodes is not None else DEFAULT_DEPTH
+    limits = {"depth": depth, "time": args.movetime, "nodes": args.nodes}
+    positions = run(args.input, args.output, limits, args.workers, args.hash, args.start_offset,
+                    args.resume, args.max_pending, out=lambda line: print(line, file=sys.stderr))
+    print(f"{positions} positions analysed", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import argparse, json, sys, time
+import chess
+
+import ai_logic
+
+# Fixed positions searched to fixed depths with cleared tables, so the node
+# count is a deterministic signature of the search: if a change alters it,
+# the change altered search behaviour.
+BENCH_POSITIONS = [
+    ("opening", chess.STARTING_FEN, 3),
+    ("opening", "rnbqkb1r/pppp1ppp/5n2/4p3/4P3/2N5/PPPP1PPP/R1BQKBNR w KQkq - 2 3", 3),
+    ("opening", "r1bqkbnr/pp1ppppp/2n5/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3", 3),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 2),
+    ("middlegame", "r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 9", 2),
+    ("middlegame", "r2q1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/P4PPP/R1BQKB1R w KQ - 0 9", 2),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4),
+    ("endgame", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 4),
+    ("endgame", "8/8/4k3/8/2K5/3P4/8/8 w - - 0 1", 5),
+    ("tactical", "r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 1),
+    ("tactical", "r1b1kb1r/pppp1ppp/5q2/4n3/3KP3/2N3PN/PPP4P/R1BQ1B1R b kq - 0 1", 2),
+    ("tactical", "2r3k1/pp3ppp/8/3R4/8/8/PP3PPP/6K1 w - - 0 1", 3),
+]
+
+EVAL_TERMS = [
+    ("material_pst", ai_logic.eval_material_pst),
+    ("game_phase", ai_logic.game_phase),
+    ("pawn_structure", ai_logic.eval_pawn_structure),
+    ("king_safety", ai_logic.eval_king_safety),
+    ("rook_structure", ai_logic.eval_rook_structure),
+    ("mobility", ai_logic.eval_mobility),
+    ("end_game_mobility", ai_logic.eval_end_game_mobility),
+    ("eval", ai_logic.eval),
+    ("order_moves", ai_logic.order_moves),
+]
+
+DEFAULT_NPS_THRESHOLD = 0.10
+DEFAULT_MICRO_THRESHOLD = 0.20
+
+
+def reset_tables():
+    ai_logic.TT.clear()
+    ai_logic.PAWN_TT.clear()
+    # select_best_move only halves the history, so a previous search would still show
+    for killers in ai_logic.KILLERS:
+        killers[0] = killers[1] = None
+    for table in ai_logic.HISTORY:
+        table[:] = [0] * len(table)
+
+def run_search_bench(positions=BENCH_POSITIONS, depth=None, out=None):
+    results = []
+    for category, fen, position_depth in positions:
+        reset_tables()
+        board = chess.Board(fen)
+        times = []
+        ai_logic.select_best_move(board, None, depth or position_depth,
+                                  on_iteration=lambda d, s, m, n, q, t: times.append(round(t, 4)))
+        nodes = ai_logic.SEARCH.nodes + ai_logic.SEARCH.qnodes
+        elapsed = ai_logic.SEARCH.elapsed()
+        row = {
+            "category": category,
+            "fen": fen,
+            "depth": depth or position_depth,
+            "nodes": nodes,
+            "qnodes": ai_logic.SEARCH.qnodes,
+            "time": elapsed,
+            "nps": nodes / elapsed if elapsed > 0 else 0.0,
+            "time_to_depth": times,
+            "tt_hit_rate": ai_logic.TT.hit_rate(),
+        }
+        results.append(row)
+        if out is not None:
+            out(f"{category:<10} depth {row['depth']}  {nodes:>8} nodes  {row['time']:7.2f}s  "
+                f"{row['nps']:7.0f} nps  tt hits {row['tt_hit_rate']:.1%}")
+
+    total_nodes = sum(row["nodes"] for row in results)
+    total_time = sum(row["time"] for row in results)
+    return {
+        "positions": results,
+        "nodes": total_nodes,
+        "time": total_time,
+        "nps": total_nodes / total_time if total_time > 0 else 0.0,
+    }
+
+def time_per_call(function, boards, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for board in boards:
+            function(board)
+    return (time.perf_counter() - start) / (repeat * len(boards)) * 1e6
+
+def run_micro_bench(positions=BENCH_POSITIONS, repeat=200):
+    boards = [chess.Board(fen) for _, fen, _ in positions]
+    return {name: time_per_call(function, boards, repeat) for name, function in EVAL_TERMS}
+
+def run_bench(depth=None, repeat=200, out=None):
+    search = run_search_bench(depth=depth, out=out)
+    micro = run_micro_bench(repeat=repeat)
+    return {"search": search, "micro_us": micro}
+
+def compare(result, baseline, nps_threshold=DEFAULT_NPS_THRESHOLD, micro_threshold=DEFAULT_MICRO_THRESHOLD):
+    regressions = []
+    notes = []
+    if result["search"]["nodes"] != baseline["search"]["nodes"]:
+        notes.append(f"node signature changed: {baseline['search']['nodes']} -> {result['search']['nodes']}")
+
+    old_nps, new_nps = baseline["search"]["nps"], result["search"]["nps"]
+    if old_nps and new_nps < old_nps * (1 - nps_threshold):
+        regressions.append(f"nps {old_nps:.0f} -> {new_nps:.0f} ({new_nps / old_nps - 1:+.1%})")
+
+    for name, old in baseline["micro_us"].items():
+        new = result["micro_us"].get(name)
+        if new is not None and old and new > old * (1 + micro_threshold):
+            regressions.append(f"{name} {old:.2f}us -> {new:.2f}us ({new / old - 1:+.1%})")
+    return regressions, notes
+
+def print_summary(result, out=print):
+    search = result["search"]
+    out(f"total: {search['nodes']} nodes  {search['time']:.2f}s  {search['nps']:.0f} nps")
+    for name, us in result["micro_us"].items():
+        out(f"  {name:<18} {us:9.2f} us/call")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search and evaluation benchmark")
+    parser.add_argument("--depth", type=int, help="override the per-position depth")
+    parser.add_argument("--repeat", type=int, default=200, help="micro benchmark repetitions")
+    parser.add_argument("--save", metavar="PATH", help="write the result as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a JSON baseline")
+    parser.add_argument("--nps-threshold", type=float, default=DEFAULT_NPS_THRESHOLD)
+    parser.add_argument("--micro-threshold", type=float, default=DEFAULT_MICRO_THRESHOLD)
+    parser.add_argument("--strict-nodes", action="store_true", help="fail when the node signature changes")
+    args = parser.parse_args(argv)
+
+    result = run_bench(args.depth, args.repeat, out=print)
+    print_summary(result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, notes = compare(result, baseline, args.nps_threshold, args.micro_threshold)
+        for note in notes:
+            print(note)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions or (args.strict_nodes and notes):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import mmap, random, struct
+import chess
+
+from zobrist import zobrist_hash
+
+# Polyglot .bin books: 16-byte big-endian entries (key, move, weight, learn)
+# sorted by key. The file is memory-mapped and binary searched in place, so
+# nothing is read up front and every engine process shares the same pages.
+# Our Zobrist keys use the Polyglot layout, so the search key is the book key.
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+
+# Polyglot writes castling as the king taking its own rook
+CASTLING_TARGETS = {
+    (chess.E1, chess.H1): chess.G1,
+    (chess.E1, chess.A1): chess.C1,
+    (chess.E8, chess.H8): chess.G8,
+    (chess.E8, chess.A8): chess.C8,
+}
+
+
+def decode_move(board, raw):
+    to_square = raw & 63
+    from_square = (raw >> 6) & 63
+    promotion = (raw >> 12) & 7
+    if (from_square, to_square) in CASTLING_TARGETS and board.piece_type_at(from_square) == chess.KING:
+        to_square = CASTLING_TARGETS[(from_square, to_square)]
+    return chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            if size % ENTRY.size:
+                raise ValueError(f"{path} is not a Polyglot book")
+            # mmap refuses empty files
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entries = size // ENTRY.size
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def first_index(self, key):
+        lo, hi = 0, self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.data, mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def raw_entries(self, key):
+        found = []
+        for i in range(self.first_index(key), self.entries):
+            entry_key, raw_move, weight, _ = ENTRY.unpack_from(self.data, i * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((raw_move, weight))
+        return found
+
+    def moves(self, board, key=None):
+        # legal book moves with their weights; weight 0 marks a deleted entry
+        if key is None:
+            key = zobrist_hash(board)
+        moves = []
+        for raw_move, weight in self.raw_entries(key):
+            move = decode_move(board, raw_move)
+            if weight and board.is_legal(move):
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, board, key=None, selection="weighted", rng=random):
+        moves = self.moves(board, key)
+        if not moves:
+            return None
+        if selection == "best":
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+
+_books = {}
+
+def open_book(path):
+    # one mapping per book and process
+    if path not in _books:
+        _books[path] = OpeningBook(path)
+    return _books[path]
+
+def close_books():
+    for book in _books.values():
+        book.close()
+    _books.clear()
@@ -0,0 +1,271 @@
+import chess, random, sys
+import ai_logic
+from ai_logic import REDUCED_PENALTY, FULL_PENALTY, LINE_THREAT_EXTRA, MATERIAL_WEIGHT, PST_WEIGHT
+from ai_logic import (KING_CASTLED_BONUS, KING_SHIELD_BONUS, KING_CENTRALITY_PENALTY, KING_OPEN_SQUARE_PENALTY,
+                      KING_HEAVY_NEIGHBOUR, KING_MINOR_NEIGHBOUR, KING_PAWN_NEIGHBOUR)
+from Piece_data import shield_bonus, PIECE_VALUES, PHASE_WEIGHTS, pst_dict, end_game_pst_dict
+
+# Checks the bitboard and table-driven evaluators in ai_logic against plain
+# square-by-square implementations, kept below as the reference.
+
+# the combined tables sum floats in another order than the reference
+TOLERANCE = 1e-6
+
+SEED_FENS = [
+    chess.STARTING_FEN,
+    "r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 9",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+def reference_eval_king_safety(board):
+    total = 0
+    for piece in [chess.KING]:
+        for color in [chess.WHITE, chess.BLACK]:
+            sign = 1 if color == chess.WHITE else - 1
+            king_sq = board.pieces(piece, color)
+            king_sq = next(iter(king_sq), None)
+            if king_sq is None:
+                continue
+            piece_obj = board.piece_at(king_sq)
+            square_set = chess.SquareSet(chess.BB_KING_ATTACKS[king_sq])
+            total += reference_king_safety_adj_fct(board, sign, square_set, piece_obj)
+            
+    return total
+                    
+def reference_king_safety_adj_fct(board, sign, square_set, piece):
+    total = 0
+    castled_squares = [chess.G1, chess.C1] if piece.color == chess.WHITE else [chess.G8, chess.C8]
+    king_sq = board.king(piece.color)
+    if king_sq is None:
+        return 0
+    king_file = chess.square_file(king_sq)
+    centrality_penalty = abs(king_file - 3.5) * KING_CENTRALITY_PENALTY
+    if king_sq not in castled_squares:
+        total -= centrality_penalty * sign
+    
+    if king_sq in castled_squares:
+        total += KING_CASTLED_BONUS * sign
+        shield_rank = 6 if piece.color == chess.WHITE else 1
+        shield_files = [chess.square_file(king_sq) - 1, chess.square_file(king_sq), chess.square_file(king_sq) + 1]
+        shield_count = 0
+        for f in shield_files:
+            if 0 <= f < 8:
+                shield_piece = board.piece_at(chess.square(f, shield_rank))
+                if shield_piece and shield_piece.piece_type == chess.PAWN and shield_piece.color == piece.color:
+                    shield_count += 1
+        total += sign * KING_SHIELD_BONUS * (2 * shield_count - 3)
+
+      
+    for sq in square_set:
+        neighbour = board.piece_at(sq)
+        if not neighbour:
+            total -= KING_OPEN_SQUARE_PENALTY * sign
+            continue
+        
+        if neighbour.piece_type in [chess.ROOK, chess.QUEEN]:
+            value = KING_HEAVY_NEIGHBOUR
+        elif neighbour.piece_type in [chess.KNIGHT, chess.BISHOP]:
+            value = KING_MINOR_NEIGHBOUR
+        elif neighbour.piece_type == chess.PAWN:
+            value = KING_PAWN_NEIGHBOUR
+        else:   
+            continue
+
+        if neighbour.color == piece.color:
+            total += value * sign
+        else:
+            total -= value * sign
+    total += reference_king_safety_long_threat_fct(board, sign, king_sq, piece)
+    return total
+
+        
+
+def reference_king_safety_long_threat_fct(board, sign, king_sq, piece):   
+    total = 0 
+    row, col = divmod(king_sq, 8)
+    directions = [(1,-1), (1,1), (-1, -1), (-1, 1), (1,0), (0, -1), (0, 1), (-1, 0)]
+    for dr, dc in directions:
+        distance = 0
+        piece_on_ray = None
+        target = (row + dr, col + dc)
+        target_r, target_c = target
+        square = target_r * 8 + target_c
+        while 0<=target_r<8 and 0<=target_c<8:
+            square = target_r * 8 + target_c
+            if board.piece_at(square):
+                piece_on_ray = board.piece_at(square)
+                break
+            target_r += dr
+            target_c += dc
+        if piece_on_ray:
+            
+            distance = max(abs(target_r - row), abs(target_c - col))
+            if distance == 1:
+                continue
+            
+            if piece_on_ray.color == piece.color:
+                total+= shield_bonus.get(piece_on_ray.piece_type, 0) * sign
+                target_r += dr
+                target_c += dc
+                
+                while 0<=target_r<8 and 0<=target_c<8:
+                    square = target_r * 8 + target_c
+                    shield_ray_piece = board.piece_at(square)
+                    if shield_ray_piece:
+                        if shield_ray_piece.color != piece.color:
+                            if abs(dr) == abs(dc) and shield_ray_piece.piece_type in [chess.BISHOP, chess.QUEEN]:
+                                total -= REDUCED_PENALTY * sign
+                            elif shield_ray_piece.piece_type in [chess.QUEEN, chess.ROOK]:
+                                total -= (REDUCED_PENALTY + LINE_THREAT_EXTRA) * sign
+                        break
+                    target_r += dr
+                    target_c += dc
+            else:
+                if abs(dr) == abs(dc) and piece_on_ray.piece_type in [chess.BISHOP, chess.QUEEN]:
+                    total -= FULL_PENALTY * sign
+                elif piece_on_ray.piece_type in [chess.ROOK, chess.QUEEN]:
+                    total -= (FULL_PENALTY + LINE_THREAT_EXTRA) * sign
+
+    return total
+
+
+def reference_eval_rook_structure(board):
+    total = 0
+    directions = [(1,0), (0, -1), (0, 1), (-1, 0)]
+    for color in [chess.WHITE, chess.BLACK]:
+        king_sq = board.pieces(chess.KING, color)
+        if not king_sq:
+            continue
+        sign = 1 if color == chess.WHITE else - 1
+        rook_square = board.pieces(chess.ROOK, color)
+        if not rook_square:
+            continue
+        for sq in rook_square:
+            row, col = divmod(sq, 8)
+            for dr, dc in directions:
+                found = False
+                target = (row + dr, col + dc)
+                target_r, target_c = target
+                square = target_r * 8 + target_c
+                while 0<=target_r<8 and 0<=target_c<8:
+                    square = target_r * 8 + target_c
+                    piece = board.piece_at(square)
+                    if piece and piece.color != color:
+                        found = True
+                        total += 30 * sign if piece.piece_type != chess.KING else (60 * sign)
+                        break
+                    elif piece and piece.piece_type == chess.PAWN and piece.color == color:
+                        found = True
+                        total -= 30 * sign
+                        break
+                    target_r += dr
+                    target_c += dc
+                if not found:
+                    total += 15 * sign
+    return total
+
+            
+def reference_eval_pawn_structure(board):
+    total = 0
+    white_doubled = [0] * 8
+    black_doubled = [0] * 8
+    
+    for color in [chess.WHITE, chess.BLACK]:
+        sign = 1 if color == chess.WHITE else - 1
+        square_set = board.pieces(chess.PAWN, color)
+        for sq in square_set:
+            p_r = p_l = None 
+            square = sq if color == chess.WHITE else chess.square_mirror(sq)
+            row, col = divmod(square, 8)
+            if color == chess.WHITE:
+                white_doubled[col] += 1
+            else:
+                black_doubled[col] += 1
+            if 0 <= row < 8: 
+                if 0 < col < 7:
+                    adj_r = (row + 1) * 8 + (col + 1) if color == chess.WHITE else (row - 1) * 8 + (col + 1)
+                    p_r = board.piece_at(adj_r)
+                    adj_l = (row + 1) * 8 + (col - 1) if color == chess.WHITE else (row - 1) * 8 + (col - 1)
+                    p_l = board.piece_at(adj_l)
+                elif col == 0:
+                    adj_r = (row + 1) * 8 + (col + 1) if color == chess.WHITE else (row - 1) * 8 + (col + 1)
+                    p_r = board.piece_at(adj_r)
+                elif col == 7:
+                    adj_l = (row + 1) * 8 + (col - 1) if color == chess.WHITE else (row - 1) * 8 + (col - 1)
+                    p_l = board.piece_at(adj_l)
+                    
+            if (p_r and p_r.piece_type == chess.PAWN) or (p_l and p_l.piece_type == chess.PAWN):
+                total += 30 * sign 
+                
+        for file in range(8):
+            if sign == 1:
+                total -= (white_doubled[file] - 1) * 30 
+            else:
+                total += (black_doubled[file] - 1) * 30
+                
+    return total
+
+def reference_eval_material_pst(board):
+    # material and PST scaled linearly with the phase, then weighted, as eval
+    # combines them; the middlegame and endgame tables are blended the same way
+    phase = 0
+    for piece, weight in PHASE_WEIGHTS.items():
+        phase += weight * (len(board.pieces(piece, chess.WHITE)) + len(board.pieces(piece, chess.BLACK)))
+    phase_norm = min(phase, 24) / 24.0
+    total = 0
+    for color in [chess.WHITE, chess.BLACK]:
+        sign = 1 if color == chess.WHITE else - 1
+        for piece in [chess.PAWN, chess.BISHOP, chess.KNIGHT, chess.ROOK, chess.QUEEN, chess.KING]:
+            for sq in board.pieces(piece, color):
+                idx = chess.square_mirror(sq) if color == chess.BLACK else sq
+                material = PIECE_VALUES[piece] * (1 - 0.65 * (1 - phase_norm))
+                mid = pst_dict[piece][idx] * 1.15
+                end = end_game_pst_dict[piece][idx] * 2.15
+                pst = mid * phase_norm + end * (1 - phase_norm)
+                total += (material * MATERIAL_WEIGHT + pst * PST_WEIGHT) * sign
+    return total
+
+TERMS = [
+    ("material_pst", ai_logic.eval_material_pst, reference_eval_material_pst),
+    ("king_safety", ai_logic.eval_king_safety, reference_eval_king_safety),
+    ("rook_structure", ai_logic.eval_rook_structure, reference_eval_rook_structure),
+    ("pawn_structure", ai_logic.eval_pawn_structure, reference_eval_pawn_structure),
+]
+
+def random_positions(count, seed=0, max_plies=120):
+    rng = random.Random(seed)
+    fens = list(SEED_FENS)
+    while len(fens) < count:
+        board = chess.Board(rng.choice(SEED_FENS))
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+            fens.append(board.fen())
+    return fens[:count]
+
+def compare(fens):
+    mismatches = []
+    for fen in fens:
+        board = chess.Board(fen)
+        for name, current, reference in TERMS:
+            expected = reference(board)
+            actual = current(board)
+            if abs(actual - expected) > TOLERANCE:
+                mismatches.append((fen, name, expected, actual))
+    return mismatches
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    fens = random_positions(count)
+    mismatches = compare(fens)
+    for fen, name, expected, actual in mismatches[:20]:
+        print(f"{name}: expected {expected}, got {actual} in {fen}")
+    print(f"{len(fens)} positions, {len(TERMS)} terms, {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,254 @@
+import argparse, ast, math, multiprocessing, os, sys, time
+import chess
+
+import ai_logic
+from Piece_data import tapered_tables
+from transposition import TranspositionTable, PawnHashTable
+from zobrist import zobrist_hash, push_move
+
+# Self-play between two configurations of ai_logic. A configuration is a set
+# of module globals to override (pruning switches, eval weights, margins...).
+# Each game runs in a pool worker that swaps the overrides and its own tables
+# in before every move, so both sides play in the same process on equal terms.
+# The match stops early once a sequential probability ratio test decides.
+
+OPENINGS = [
+    chess.STARTING_FEN,
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 1 2",
+    "rnbqkbnr/pppppppp/8/8/2P5/8/PP1PPPPP/RNBQKBNR b KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b KQkq - 1 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5",
+    "rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkb1r/pppp1ppp/5n2/4p3/2P5/2N5/PP1PPPPP/R1BQKBNR w KQkq - 2 3",
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkb1r/pppp1ppp/4pn2/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkbnr/ppp1pppp/8/8/3Pp3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3",
+]
+
+MAX_PLIES = 300            # longer games are scored as draws
+RESIGN_SCORE = 1000        # both sides agree the game is this lopsided...
+RESIGN_MOVES = 4           # ...for this many moves each
+
+
+def parse_overrides(items):
+    # NAME=VALUE pairs; values are Python literals, bare words are strings
+    overrides = {}
+    for item in items or ():
+        name, _, value = item.partition("=")
+        if not hasattr(ai_logic, name):
+            raise ValueError(f"ai_logic has no setting {name}")
+        try:
+            overrides[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[name] = value
+    return overrides
+
+
+class Side:
+    # one engine: its overrides plus tables of its own
+    def __init__(self, overrides, hash_mb):
+        self.overrides = dict(overrides)
+        if "MATERIAL_WEIGHT" in overrides or "PST_WEIGHT" in overrides:
+            # these two are folded into the combined tables, which have to follow
+            self.overrides["MG_TABLE"], self.overrides["EG_TABLE"] = tapered_tables(
+                overrides.get("MATERIAL_WEIGHT", ai_logic.MATERIAL_WEIGHT), overrides.get("PST_WEIGHT", ai_logic.PST_WEIGHT))
+        self.overrides["TT"] = TranspositionTable(hash_mb)
+        self.overrides["PAWN_TT"] = PawnHashTable()
+        self.overrides["KILLERS"] = [[None, None] for _ in range(ai_logic.MAX_PLY)]
+        self.overrides["HISTORY"] = [[0] * 4096, [0] * 4096]
+        self.nodes = 0
+        self.time = 0.0
+
+    def play(self, board, key, limits):
+        saved = {name: getattr(ai_logic, name) for name in self.overrides}
+        for name, value in self.overrides.items():
+            setattr(ai_logic, name, value)
+        score = None
+        def on_iteration(depth, value, move, nodes, qnodes, elapsed):
+            nonlocal score
+            score = value
+        try:
+            move = ai_logic.select_best_move(board, key, limits["depth"], limits["time"], on_iteration, limits["nodes"])
+        finally:
+            for name, value in saved.items():
+                setattr(ai_logic, name, value)
+        self.nodes += ai_logic.SEARCH.nodes + ai_logic.SEARCH.qnodes
+        self.time += ai_logic.SEARCH.elapsed()
+        return move, score
+
+
+def play_game(task):
+    # returns the result from the first configuration's point of view
+    index, fen, config_a, config_b, a_is_white, limits, hash_mb = task
+    board = chess.Board(fen)
+    key = zobrist_hash(board)
+    a, b = Side(config_a, hash_mb), Side(config_b, hash_mb)
+    sides = {chess.WHITE: a if a_is_white else b, chess.BLACK: b if a_is_white else a}
+
+    lopsided = 0
+    last_score = 0
+    result = None
+    while result is None:
+        if board.is_game_over(claim_draw=True):
+            result = board.result(claim_draw=True)
+            break
+        if board.ply() >= MAX_PLIES:
+            result = "1/2-1/2"
+            break
+        move, score = sides[board.turn].play(board, key, limits)
+        # adjudicate once both engines have agreed for a while (white's point of view)
+        if score is not None and abs(score) >= RESIGN_SCORE:
+            lopsided = lopsided + 1 if (score > 0) == (last_score > 0) else 1
+            last_score = score
+            if lopsided >= 2 * RESIGN_MOVES:
+                result = "1-0" if score > 0 else "0-1"
+        else:
+            lopsided = 0
+        key = push_move(board, move, key)
+
+    white_points = {"1-0": 1.0, "0-1": 0.0}.get(result, 0.5)
+    return {
+        "index": index,
+        "score": white_points if a_is_white else 1.0 - white_points,
+        "plies": board.ply(),
+        "nodes": (a.nodes, b.nodes),
+        "time": (a.time, b.time),
+    }
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo_estimate(wins, draws, losses):
+    # Elo difference and its 95% error margin from the observed scores
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    margin = 1.96 * math.sqrt(max(variance, 0.0) / games)
+    def to_elo(s):
+        s = min(max(s, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / s - 1)
+    return to_elo(score), (to_elo(score + margin) - to_elo(score - margin)) / 2
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    # log-likelihood ratio of H1 (elo1) against H0 (elo0), in the usual normal
+    # approximation of the game results
+    games = wins + draws + losses
+    if not games or not wins + draws or not losses + draws:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    if variance <= 0:
+        return 0.0
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return (s1 - s0) * (2 * score - s0 - s1) * games / (2 * variance)
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_match(config_a, config_b, games=200, workers=None, limits=None, hash_mb=16,
+              elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05, openings=OPENINGS, out=None):
+    limits = limits or {"depth": ai_logic.MAX_DEPTH, "time": 0.1, "nodes": None}
+    workers = workers or os.cpu_count() or 1
+    lower, upper = sprt_bounds(alpha, beta)
+    # each opening is played twice with colors swapped
+    tasks = [(i, openings[(i // 2) % len(openings)], config_a, config_b, i % 2 == 0, limits, hash_mb)
+             for i in range(games)]
+
+    wins = draws = losses = 0
+    nodes, seconds = [0, 0], [0.0, 0.0]
+    llr = 0.0
+    verdict = None
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(workers)
+    try:
+        for game in pool.imap_unordered(play_game, tasks):
+            if game["score"] == 1.0:
+                wins += 1
+            elif game["score"] == 0.0:
+                losses += 1
+            else:
+                draws += 1
+            for side in (0, 1):
+                nodes[side] += game["nodes"][side]
+                seconds[side] += game["time"][side]
+            llr = sprt_llr(wins, draws, losses, elo0, elo1)
+            if out is not None:
+                out(f"game {wins + draws + losses}: +{wins} ={draws} -{losses}  llr {llr:.2f} ({lower:.2f}, {upper:.2f})")
+            if llr >= upper:
+                verdict = "H1"
+                break
+            if llr <= lower:
+                verdict = "H0"
+                break
+    finally:
+        # stopping early leaves games in flight that nobody needs
+        pool.terminate()
+        pool.join()
+
+    elapsed = time.perf_counter() - start
+    played = wins + draws + losses
+    elo, margin = elo_estimate(wins, draws, losses)
+    return {
+        "games": played,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "elo": elo,
+        "elo_margin": margin,
+        "llr": llr,
+        "llr_bounds": (lower, upper),
+        "verdict": verdict,
+        "games_per_hour": played / elapsed * 3600 if elapsed > 0 else 0.0,
+        "nps": tuple(nodes[side] / seconds[side] if seconds[side] else 0.0 for side in (0, 1)),
+    }
+
+def print_report(result, out=print):
+    out(f"games {result['games']}: +{result['wins']} ={result['draws']} -{result['losses']}")
+    out(f"elo {result['elo']:+.1f} +- {result['elo_margin']:.1f}")
+    lower, upper = result["llr_bounds"]
+    verdict = {"H1": "H1 accepted (A is stronger)", "H0": "H0 accepted (A is not stronger)"}.get(result["verdict"], "inconclusive")
+    out(f"sprt llr {result['llr']:.2f} ({lower:.2f}, {upper:.2f}): {verdict}")
+    out(f"{result['games_per_hour']:.0f} games/hour, nps A {result['nps'][0]:.0f}, B {result['nps'][1]:.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Self-play match between two ai_logic configurations")
+    parser.add_argument("-a", action="append", metavar="NAME=VALUE", help="override for engine A (repeatable)")
+    parser.add_argument("-b", action="append", metavar="NAME=VALUE", help="override for engine B (repeatable)")
+    parser.add_argument("--games", type=int, default=200, help="maximum number of games")
+    parser.add_argument("--workers", type=int, help="concurrent games (default: all cores)")
+    parser.add_argument("--movetime", type=float, help="seconds per move (default 0.1)")
+    parser.add_argument("--nodes", type=int, help="node budget per move")
+    parser.add_argument("--depth", type=int, help="fixed depth per move")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table MB per engine")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=5.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.movetime is None and args.nodes is None and args.depth is None:
+        args.movetime = 0.1
+    limits = {"depth": args.depth or ai_logic.MAX_DEPTH, "time": args.movetime, "nodes": args.nodes}
+    result = run_match(parse_overrides(args.a), parse_overrides(args.b), args.games, args.workers, limits,
+                       args.hash, args.elo0, args.elo1, args.alpha, args.beta, out=print)
+    print_report(result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
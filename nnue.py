@@ -0,0 +1,300 @@
+import argparse, hashlib, mmap, struct, sys, time
+import chess
+import numpy as np
+
+from zobrist import move_changes
+
+# Efficiently updatable network: king-relative piece-square features (HalfKP)
+# feed a first layer kept per side as an int16 accumulator, updated by adding
+# and subtracting weight rows as moves are made, so a leaf only runs the small
+# layers behind it:
+#   features -> L1 (x2 sides, clipped) -> L2 -> L3 -> 1
+# Weights are stored quantized: the first layer to int16 at scale QA, the
+# others to int8 at scale QB. The accumulator adds int16 rows; the layers after
+# it are so small that numpy's per-call overhead is most of their cost, so they
+# run as float32 products in as few calls as possible. The output is
+# centipawns for the side to move.
+
+PIECE_SLOTS = 10                      # pawn..queen for each colour, kings index the feature set
+FEATURES = 64 * PIECE_SLOTS * 64
+L1 = 128
+L2 = 32
+L3 = 32
+QA = 127
+QB = 64
+OUTPUT_SCALE = 600.0
+
+# Weight files: header padded to 64 bytes, then the layers in layout() order,
+# little-endian. The file is memory-mapped and the big first layer is used in
+# place, so only the rows the positions touch are ever read.
+NNUE_MAGIC = b"CENN"
+NNUE_VERSION = 1
+NNUE_HEADER = struct.Struct("<4sIIIIIf")   # magic, version, features, l1, l2, l3, output scale
+NNUE_HEADER_BYTES = 64
+
+
+def layout(features, l1, l2, l3):
+    return [
+        ("w1", np.int16, (features, l1)),
+        ("b1", np.int16, (l1,)),
+        ("w2", np.int8, (l2, 2 * l1)),
+        ("b2", np.int32, (l2,)),
+        ("w3", np.int8, (l3, l2)),
+        ("b3", np.int32, (l3,)),
+        ("w4", np.int8, (l3,)),
+        ("b4", np.int32, (1,)),
+    ]
+
+def feature_index(perspective, king, color, piece, sq):
+    # squares are seen from the perspective's side of the board
+    if perspective == chess.BLACK:
+        king ^= 56
+        sq ^= 56
+    return (king * PIECE_SLOTS + (piece - 1) * 2 + (color != perspective)) * 64 + sq
+
+def active_features(board, perspective):
+    king = board.king(perspective)
+    indices = []
+    for color in chess.COLORS:
+        for piece in range(chess.PAWN, chess.KING):
+            for sq in chess.scan_forward(board.pieces_mask(piece, color)):
+                indices.append(feature_index(perspective, king, color, piece, sq))
+    return indices
+
+
+class Network:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(NNUE_HEADER_BYTES)
+            if len(header) < NNUE_HEADER_BYTES:
+                raise ValueError(f"{path} is not a network file")
+            magic, version, features, l1, l2, l3, output_scale = NNUE_HEADER.unpack_from(header)
+            if magic != NNUE_MAGIC or version != NNUE_VERSION or features != FEATURES:
+                raise ValueError(f"{path} is not a network file of this version")
+            sections = layout(features, l1, l2, l3)
+            size = NNUE_HEADER_BYTES + sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in sections)
+            if f.seek(0, 2) != size:
+                raise ValueError(f"{path} has the wrong size for its layer sizes")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        layers = {}
+        offset = NNUE_HEADER_BYTES
+        for name, dtype, shape in sections:
+            count = int(np.prod(shape))
+            layers[name] = np.frombuffer(self.data, dtype, count, offset).reshape(shape)
+            offset += count * np.dtype(dtype).itemsize
+        self.w1 = layers["w1"]
+        self.b1 = layers["b1"].copy()
+        # later layers rescaled so every activation is again in units of QA
+        self.w2, self.b2 = layers["w2"] / np.float32(QB), layers["b2"].astype(np.float32) / QB
+        self.w3, self.b3 = layers["w3"] / np.float32(QB), layers["b3"].astype(np.float32) / QB
+        self.w4 = layers["w4"] * np.float32(output_scale / (QA * QB))
+        self.b4 = float(layers["b4"][0]) * output_scale / (QA * QB)
+        self.input = np.empty(2 * l1, np.float32)
+        self._digest = None
+
+    def close(self):
+        # the views have to go before the mapping can be closed
+        self.w1 = None
+        self.data.close()
+
+    def digest(self):
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.data).digest()
+        return self._digest
+
+    def refresh(self, board, perspective):
+        rows = self.w1[active_features(board, perspective)]
+        return self.b1 + rows.sum(axis=0, dtype=np.int16)
+
+    def accumulator(self, board=None):
+        return Accumulator(self, board)
+
+    def forward(self, us, them):
+        x = self.input
+        half = len(us)
+        x[:half] = us
+        x[half:] = them
+        np.maximum(x, 0, out=x)
+        np.minimum(x, QA, out=x)
+        for weights, bias in ((self.w2, self.b2), (self.w3, self.b3)):
+            x = weights @ x
+            x += bias
+            np.maximum(x, 0, out=x)
+            np.minimum(x, QA, out=x)
+        return float(self.w4 @ x) + self.b4
+
+    def evaluate(self, board, accumulator=None):
+        # centipawns for the side to move
+        if accumulator is None:
+            return self.forward(self.refresh(board, board.turn), self.refresh(board, not board.turn))
+        return self.forward(accumulator.get(board, board.turn), accumulator.get(board, not board.turn))
+
+
+class Accumulator:
+    # First-layer sums per perspective, indexed by colour, as (values, king
+    # square). A king move changes every feature of its side, so that side is
+    # left empty and rebuilt from the board when it is next evaluated.
+    def __init__(self, network, board=None):
+        self.network = network
+        self.entries = [None, None]
+        self.stack = []
+        if board is not None:
+            self.reset(board)
+
+    def reset(self, board):
+        self.entries = [(self.network.refresh(board, color), board.king(color)) for color in (chess.BLACK, chess.WHITE)]
+        self.stack = []
+
+    def push(self, changes):
+        self.stack.append(self.entries)
+        entries = list(self.entries)
+        for color, piece, _, _ in changes:
+            if piece == chess.KING:
+                entries[color] = None
+        w1 = self.network.w1
+        for perspective in chess.COLORS:
+            if entries[perspective] is None:
+                continue
+            values, king = entries[perspective]
+            values = values.copy()
+            for color, piece, sq, delta in changes:
+                if piece == chess.KING:
+                    continue
+                row = w1[feature_index(perspective, king, color, piece, sq)]
+                if delta > 0:
+                    values += row
+                else:
+                    values -= row
+            entries[perspective] = (values, king)
+        self.entries = entries
+
+    def push_null(self):
+        # same pieces: the frames can share their entries, refreshes included
+        self.stack.append(self.entries)
+
+    def pop(self):
+        self.entries = self.stack.pop()
+
+    def get(self, board, perspective):
+        entry = self.entries[perspective]
+        if entry is None:
+            entry = self.entries[perspective] = (self.network.refresh(board, perspective), board.king(perspective))
+        return entry[0]
+
+    def verify(self, board):
+        for perspective in chess.COLORS:
+            expected = self.network.refresh(board, perspective)
+            if not np.array_equal(self.get(board, perspective), expected):
+                raise AssertionError(f"incremental accumulator for {chess.COLOR_NAMES[perspective]} "
+                                     f"!= full refresh in {board.fen()}")
+
+
+_networks = {}
+
+def open_network(path):
+    # one mapping per file and process
+    if path not in _networks:
+        _networks[path] = Network(path)
+    return _networks[path]
+
+def close_networks():
+    for network in _networks.values():
+        network.close()
+    _networks.clear()
+
+
+def random_params(l1=L1, l2=L2, l3=L3, seed=0):
+    # float weights of an untrained network, for trying the format and the speed
+    rng = np.random.default_rng(seed)
+    return {
+        "w1": rng.normal(0, 0.1, (FEATURES, l1)),
+        "b1": rng.uniform(0, 0.5, l1),
+        "w2": rng.normal(0, 1 / np.sqrt(2 * l1), (l2, 2 * l1)),
+        "b2": np.zeros(l2),
+        "w3": rng.normal(0, 1 / np.sqrt(l2), (l3, l2)),
+        "b3": np.zeros(l3),
+        "w4": rng.normal(0, 1 / np.sqrt(l3), l3),
+        "b4": np.zeros(1),
+    }
+
+def write_network(path, params, output_scale=OUTPUT_SCALE):
+    # params holds the float weights of LAYOUT; a clipped activation of 1.0 is QA
+    l1, l2, l3 = params["w1"].shape[1], params["w2"].shape[0], params["w3"].shape[0]
+    scales = {"w1": QA, "b1": QA, "w2": QB, "b2": QA * QB, "w3": QB, "b3": QA * QB, "w4": QB, "b4": QA * QB}
+    with open(path, "wb") as f:
+        f.write(NNUE_HEADER.pack(NNUE_MAGIC, NNUE_VERSION, FEATURES, l1, l2, l3, output_scale).ljust(NNUE_HEADER_BYTES, b"\0"))
+        for name, dtype, shape in layout(FEATURES, l1, l2, l3):
+            info = np.iinfo(dtype)
+            quantized = np.clip(np.round(np.asarray(params[name]) * scales[name]), info.min, info.max)
+            f.write(quantized.astype(np.dtype(dtype).newbyteorder("<")).reshape(shape).tobytes())
+
+
+def evals_per_second(evaluate, boards, repeat, incremental=None):
+    # every legal move of every board is made, evaluated and taken back, the
+    # way a search reaches its leaves; incremental(board) returns (push, pop)
+    count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for board in boards:
+            push, pop = incremental(board) if incremental else (None, None)
+            for move in board.legal_moves:
+                if push:
+                    push(move_changes(board, move))
+                board.push(move)
+                evaluate(board)
+                board.pop()
+                if pop:
+                    pop()
+                count += 1
+    return count / (time.perf_counter() - start)
+
+def run_bench(path, repeat=5, out=print):
+    import ai_logic, bench
+    network = open_network(path)
+    boards = [chess.Board(fen) for _, fen, _ in bench.BENCH_POSITIONS]
+    classical = ai_logic.EvalAccumulator()
+    accumulator = network.accumulator()
+
+    def classical_incremental(board):
+        classical.reset(board)
+        return classical.push, classical.pop
+
+    def network_incremental(board):
+        accumulator.reset(board)
+        return accumulator.push, accumulator.pop
+
+    results = {
+        "classical": evals_per_second(ai_logic.eval, boards, repeat),
+        "classical incremental": evals_per_second(lambda board: ai_logic.eval(board, acc=classical), boards, repeat,
+                                                  classical_incremental),
+        "nnue refresh": evals_per_second(network.evaluate, boards, repeat),
+        "nnue incremental": evals_per_second(lambda board: network.evaluate(board, accumulator), boards, repeat,
+                                             network_incremental),
+    }
+    for name, rate in results.items():
+        out(f"{name:<22} {rate:9.0f} evals/s  {1e6 / rate:8.1f} us/eval")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NNUE weight files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init", help="write an untrained network with random weights")
+    init.add_argument("path")
+    init.add_argument("--l1", type=int, default=L1)
+    init.add_argument("--seed", type=int, default=0)
+    bench_parser = commands.add_parser("bench", help="evals/s of the network against the classical eval")
+    bench_parser.add_argument("path")
+    bench_parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        write_network(args.path, random_params(l1=args.l1, seed=args.seed))
+    else:
+        run_bench(args.path, args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
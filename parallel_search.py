@@ -0,0 +1,206 @@
+import atexit, chess, multiprocessing, sys, time
+from multiprocessing import shared_memory
+
+import ai_logic
+from ai_logic import SearchTimeout
+from transposition import TranspositionTable
+from zobrist import zobrist_hash
+
+# Root splitting: at every iteration the root moves are spread over a process
+# pool, and all workers share one transposition table in shared memory, so a
+# line refuted under one root move is cheap for the others. The root is PVS:
+# the first move is searched alone with a full window, and its score becomes a
+# shared alpha that every later move is tested against with a null window,
+# re-searched only when it beats it. Alpha rises as workers find better moves.
+
+_shared_tt = None
+_shared_alpha = None
+
+
+def _init_worker(shm_name, stop_event, shared_alpha):
+    global _shared_tt, _shared_alpha
+    _shared_tt = shared_memory.SharedMemory(name=shm_name)
+    ai_logic.TT = TranspositionTable(buffer=_shared_tt.buf)
+    ai_logic.SEARCH.stop_event = stop_event
+    _shared_alpha = shared_alpha
+
+def _raise_alpha(score):
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+
+def _search_root_move(task):
+    # Returns the score from the side to move's point of view and the alpha it
+    # was searched against: a score at or below that alpha is only a bound.
+    board, key, move, depth, search_id, deadline, syzygy_path, nnue_file, first = task
+    ai_logic.TT.age = search_id & 0xFF
+    ai_logic.SYZYGY_PATH = syzygy_path
+    ai_logic.load_tablebase()
+    ai_logic.NNUE_FILE = nnue_file
+    ai_logic.load_network()
+    ai_logic.SEARCH.reset(None if deadline is None else max(0.0, deadline - time.time()))
+    ai_logic.ACCUMULATOR.reset(board)
+    alpha = -float('inf') if first else _shared_alpha.value
+    try:
+        child_key = ai_logic.make_move(board, move, key)
+        if first:
+            score = -ai_logic.negamax(board, child_key, depth - 1, -float('inf'), float('inf'), 1)
+        else:
+            score = -ai_logic.negamax(board, child_key, depth - 1, -alpha - 1, -alpha, 1)
+            if score > alpha:
+                score = -ai_logic.negamax(board, child_key, depth - 1, -float('inf'), -alpha, 1)
+        _raise_alpha(score)
+    except SearchTimeout:
+        score = None
+    return move, score, alpha, ai_logic.SEARCH.nodes, ai_logic.SEARCH.qnodes
+
+
+class ParallelSearch:
+    def __init__(self, workers, tt_size_mb=None):
+        self.workers = workers
+        self.search_id = 0
+        self.nodes = 0
+        self.qnodes = 0
+        self.pool = None
+        self.shm = None
+        if workers > 1:
+            size = TranspositionTable.bytes_for(tt_size_mb or ai_logic.TT_SIZE_MB)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            # spawn, not fork: a forked child can inherit a lock another thread
+            # holds (the UCI loop blocked on stdin) and hang at startup
+            context = multiprocessing.get_context("spawn")
+            self.stop_event = context.Event()
+            self.alpha = context.Value("d", -float('inf'))
+            self.pool = context.Pool(workers, initializer=_init_worker,
+                                     initargs=(self.shm.name, self.stop_event, self.alpha))
+            self.tt = TranspositionTable(buffer=self.shm.buf)
+            # start the workers from what this process already knows, e.g. a loaded snapshot
+            main_table = memoryview(ai_logic.TT.buffer)
+            if len(main_table) == size:
+                self.shm.buf[:size] = main_table
+                self.tt.age = ai_logic.TT.age
+
+    def stop(self):
+        if self.pool is None:
+            ai_logic.stop_search()
+        else:
+            self.stop_event.set()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            del self.tt
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def select_best_move(self, board, hash, depth, time_limit=None, on_iteration=None, node_limit=None):
+        # a single worker is exactly the serial search, so results stay deterministic
+        if self.pool is None:
+            move = ai_logic.select_best_move(board, hash, depth, time_limit, on_iteration, node_limit)
+            self.nodes, self.qnodes = ai_logic.SEARCH.nodes, ai_logic.SEARCH.qnodes
+            return move
+
+        if hash is None:
+            hash = zobrist_hash(board)
+        self.search_id += 1
+        self.stop_event.clear()
+        self.nodes = self.qnodes = 0
+        start = time.perf_counter()
+        deadline = time.time() + time_limit if time_limit is not None else None
+        sign = ai_logic.perspective(board)
+
+        best_move = None
+        best_value = None
+        for current_depth in range(1, depth + 1):
+            tasks = [(board, hash, move, current_depth, self.search_id, deadline, ai_logic.SYZYGY_PATH,
+                      ai_logic.NNUE_FILE, index == 0)
+                     for index, move in enumerate(ai_logic.order_moves(board, best_move))]
+            if not tasks:
+                break
+            # the first move sets alpha before the others are handed out
+            self.alpha.value = -float('inf')
+            results = [self.pool.apply(_search_root_move, (tasks[0],))]
+            if results[0][1] is not None:
+                results += self.pool.map(_search_root_move, tasks[1:], chunksize=1)
+
+            iteration_move = None
+            iteration_value = None
+            complete = True
+            for move, score, alpha, nodes, qnodes in results:
+                self.nodes += nodes
+                self.qnodes += qnodes
+                if score is None:
+                    complete = False
+                elif score > alpha and (iteration_move is None or score > iteration_value):
+                    iteration_move, iteration_value = move, score
+            if not complete:
+                break
+
+            best_move, best_value = iteration_move, iteration_value
+            elapsed = time.perf_counter() - start
+            if on_iteration is not None:
+                on_iteration(current_depth, best_value * sign, best_move, self.nodes, self.qnodes, elapsed)
+            if time_limit is not None and elapsed >= time_limit * ai_logic.SOFT_TIME_FRACTION:
+                break
+            if self.stop_event.is_set():
+                break
+            # workers can't share a node budget, so it is only checked between iterations
+            if node_limit is not None and self.nodes + self.qnodes >= node_limit:
+                break
+
+        if best_move is None:
+            best_move = next(iter(ai_logic.order_moves(board)), None)
+        return best_move
+
+
+_searches = {}
+
+def get_parallel_search(workers):
+    if workers not in _searches:
+        _searches[workers] = ParallelSearch(workers)
+    return _searches[workers]
+
+def close_all():
+    for search in _searches.values():
+        search.close()
+    _searches.clear()
+
+atexit.register(close_all)
+
+
+SPEEDUP_FENS = [
+    chess.STARTING_FEN,
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 9",
+]
+
+def speedup_curve(worker_counts=(1, 2, 4, 8, 16), depth=3, fens=SPEEDUP_FENS):
+    results = []
+    base_time = None
+    for workers in worker_counts:
+        search = ParallelSearch(workers)
+        nodes = 0
+        start = time.perf_counter()
+        for fen in fens:
+            ai_logic.TT.clear()
+            if search.pool is not None:
+                search.tt.clear()
+            search.select_best_move(chess.Board(fen), None, depth)
+            nodes += search.nodes + search.qnodes
+        elapsed = time.perf_counter() - start
+        search.close()
+        if base_time is None:
+            base_time = elapsed
+        results.append({"workers": workers, "time": elapsed, "nodes": nodes,
+                        "nps": nodes / elapsed, "speedup": base_time / elapsed})
+    return results
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for row in speedup_curve(depth=depth):
+        print(f"{row['workers']:>2} workers: {row['time']:7.2f}s  {row['nodes']:>9} nodes  "
+              f"{row['nps']:9.0f} nps  speedup {row['speedup']:.2f}x")
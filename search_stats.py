@@ -0,0 +1,106 @@
+import json
+
+
+class SearchStats:
+    # Counters filled in by ai_logic while a search runs with statistics on.
+    def __init__(self, profile_eval=True):
+        self.profile_eval = profile_eval
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.qcutoffs = 0
+        self.null_move_tries = 0
+        self.null_move_prunes = 0
+        self.lmr_reductions = 0
+        self.lmr_researches = 0
+        self.futility_prunes = 0
+        self.reverse_futility_prunes = 0
+        self.see_prunes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_stores = 0
+        self.tb_hits = 0
+        self.time = 0.0
+        self.depth_nodes = {}   # remaining depth -> main-search nodes
+        self.iterations = []    # one entry per completed iteration
+        self.term_calls = {}
+        self.term_time = {}
+
+    def record_term(self, name, elapsed):
+        self.term_calls[name] = self.term_calls.get(name, 0) + 1
+        self.term_time[name] = self.term_time.get(name, 0.0) + elapsed
+
+    def end_iteration(self, depth, nodes, qnodes, elapsed):
+        previous = self.iterations[-1]["nodes"] if self.iterations else 0
+        self.iterations.append({
+            "depth": depth,
+            "nodes": nodes,
+            "qnodes": qnodes,
+            "time": elapsed,
+            # effective branching factor: cost of this iteration over the previous one
+            "ebf": nodes / previous if previous else None,
+        })
+
+    def cutoff_rate(self):
+        return self.cutoffs / self.nodes if self.nodes else 0.0
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def null_move_rate(self):
+        return self.null_move_prunes / self.null_move_tries if self.null_move_tries else 0.0
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def branching_factors(self):
+        # nodes at remaining depth d - 1 per node at depth d
+        factors = {}
+        for depth, nodes in self.depth_nodes.items():
+            below = self.depth_nodes.get(depth - 1)
+            if below and nodes:
+                factors[depth] = below / nodes
+        return factors
+
+    def to_dict(self):
+        return {
+            "nodes": self.nodes,
+            "qnodes": self.qnodes,
+            "time": self.time,
+            "nps": (self.nodes + self.qnodes) / self.time if self.time else 0.0,
+            "cutoffs": self.cutoffs,
+            "cutoff_rate": self.cutoff_rate(),
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+            "qcutoffs": self.qcutoffs,
+            "null_move_tries": self.null_move_tries,
+            "null_move_prunes": self.null_move_prunes,
+            "null_move_rate": self.null_move_rate(),
+            "lmr_reductions": self.lmr_reductions,
+            "lmr_researches": self.lmr_researches,
+            "futility_prunes": self.futility_prunes,
+            "reverse_futility_prunes": self.reverse_futility_prunes,
+            "see_prunes": self.see_prunes,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_stores": self.tt_stores,
+            "tt_hit_rate": self.tt_hit_rate(),
+            "tb_hits": self.tb_hits,
+            "depth_nodes": {str(depth): nodes for depth, nodes in sorted(self.depth_nodes.items())},
+            "branching_factors": {str(depth): factor for depth, factor in sorted(self.branching_factors().items())},
+            "iterations": self.iterations,
+            "eval_terms": {
+                name: {"calls": self.term_calls[name],
+                       "time": self.term_time[name],
+                       "us_per_call": self.term_time[name] / self.term_calls[name] * 1e6}
+                for name in sorted(self.term_calls)
+            },
+        }
+
+    def to_json(self, path=None, indent=2):
+        text = json.dumps(self.to_dict(), indent=indent)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
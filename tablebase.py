@@ -0,0 +1,66 @@
+import os
+import chess, chess.syzygy
+
+# Syzygy endgame tables through python-chess. A Tablebase keeps its own
+# cache of open table files, so there is one per configured path and process
+# and it stays open across probes and searches.
+
+_tablebases = {}
+
+
+def max_pieces(directory):
+    # table files are named after their pieces, e.g. KRPvKR.rtbw
+    pieces = 0
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext == ".rtbw":
+            pieces = max(pieces, len(stem) - 1)
+    return pieces
+
+def open_tablebase(path):
+    # path may list several directories separated by os.pathsep, as UCI's SyzygyPath does
+    if path not in _tablebases:
+        tablebase = chess.syzygy.Tablebase()
+        pieces = 0
+        for directory in path.split(os.pathsep):
+            if directory and os.path.isdir(directory):
+                tablebase.add_directory(directory)
+                pieces = max(pieces, max_pieces(directory))
+        _tablebases[path] = (tablebase, pieces)
+    return _tablebases[path]
+
+def close_all():
+    for tablebase, _ in _tablebases.values():
+        tablebase.close()
+    _tablebases.clear()
+
+
+def probe_wdl(tablebase, board):
+    # 2 win, 1 win spoiled by the 50-move rule, 0 draw, -1, -2 the same for
+    # the side to move; None when the table isn't available
+    if board.castling_rights:
+        return None
+    return tablebase.get_wdl(board)
+
+def root_moves(tablebase, board):
+    # Every legal move with its WDL for the side to move, ordered best first:
+    # wins by the fewest plies to the next capture or pawn move (DTZ), so the
+    # 50-move counter keeps getting reset, losses by the most.
+    ranked = []
+    for move in board.legal_moves:
+        board.push(move)
+        try:
+            if board.is_checkmate():
+                wdl, rank = 2, 0
+            else:
+                child_wdl = probe_wdl(tablebase, board)
+                child_dtz = tablebase.get_dtz(board) if child_wdl is not None else None
+                if child_dtz is None:
+                    return None
+                wdl = -child_wdl
+                rank = abs(child_dtz) if wdl > 0 else -abs(child_dtz) if wdl < 0 else 0
+        finally:
+            board.pop()
+        ranked.append((wdl, rank, move))
+    ranked.sort(key=lambda entry: (-entry[0], entry[1]))
+    return ranked
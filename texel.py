@@ -0,0 +1,388 @@
+import argparse, hashlib, json, math, multiprocessing, os, sys, time
+import chess, chess.pgn
+import numpy as np
+
+import ai_logic
+from Piece_data import (PHASE_MAX, MG_MATERIAL_SCALE, EG_MATERIAL_SCALE, MG_PST_SCALE, EG_PST_SCALE, PHASE_WEIGHTS,
+                        pst_dict, piece_index)
+
+# Texel tuning. eval is linear in its weights and constants, so each labelled
+# position is reduced once to what every parameter multiplies, those features
+# are cached on disk as numpy arrays, and the parameters are then fitted by
+# full-batch gradient descent on
+#   E = mean((result - 1 / (1 + 10 ** (-K * eval / 400))) ** 2)
+# with the gradient summed over shards of the cache in a process pool.
+#
+# Material and PSTs are fitted as the combined middlegame/endgame table entries
+# (MG_TABLE/EG_TABLE, by piece type and square from white's side) and split
+# back into piece values and PSTs when the parameter file is written.
+# MATERIAL_WEIGHT, PST_WEIGHT and KING_SAFETY_WEIGHT stay as they are: they
+# only scale parameters that are fitted themselves.
+
+TERM_WEIGHTS = ["PAWN_STRUCTURE_WEIGHT", "ROOK_STRUCTURE_WEIGHT", "MOBILITY_WEIGHT", "END_GAME_MOBILITY_WEIGHT"]
+KING_CONSTANTS = ["KING_CASTLED_BONUS", "KING_SHIELD_BONUS", "KING_CENTRALITY_PENALTY", "KING_OPEN_SQUARE_PENALTY",
+                  "KING_HEAVY_NEIGHBOUR", "KING_MINOR_NEIGHBOUR", "KING_PAWN_NEIGHBOUR", "REDUCED_PENALTY",
+                  "FULL_PENALTY", "LINE_THREAT_EXTRA"]
+SHIELD_PIECES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+TABLE_SIZE = 6 * 64
+MAX_PIECES = 32
+PAD = TABLE_SIZE                 # piece lists are padded with a slot that is always 0
+CACHE_ARRAYS = ["pieces", "signs", "mg_fraction", "dense", "results"]
+
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+DEFAULT_SKIP_PLIES = 8           # PGN positions this close to the start are mostly book
+CHUNK_SIZE = 2048                # positions per extraction task
+SHARD_SIZE = 100000              # cached positions per gradient task
+CHECK_EVERY = 64                 # positions between checks of the features against eval
+DEFAULT_EPOCHS = 300
+DEFAULT_LEARNING_RATE = 1.0      # centipawns a parameter may move the eval per step
+ADAM_BETAS = (0.9, 0.999)
+LN10_400 = math.log(10) / 400
+
+
+def read_labelled(path, skip_plies=DEFAULT_SKIP_PLIES):
+    # (fen, result for white); EPD takes the result from a c9 or result opcode
+    if path.lower().endswith(".pgn"):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                result = RESULTS.get(game.headers.get("Result"))
+                if result is None:
+                    continue
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves(), 1):
+                    board.push(move)
+                    if ply >= skip_plies:
+                        yield board.fen(), result
+        return
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            board, operations = chess.Board.from_epd(line)
+            result = RESULTS.get(operations.get("c9", operations.get("result")))
+            if result is not None:
+                yield board.fen(), result
+
+def quiet(board):
+    # a static eval is only a fair guess at the result where nothing hangs
+    if board.is_check():
+        return False
+    return all(ai_logic.capture_score(board, move) <= 0 for move in board.generate_legal_captures())
+
+
+def king_safety_features(board):
+    # King safety is linear in its constants: evaluated with one of them at 1
+    # and the rest at 0, it gives what that constant multiplies.
+    saved = {name: getattr(ai_logic, name) for name in KING_CONSTANTS}
+    saved_shield = ai_logic.shield_bonus
+    features = []
+    try:
+        for name in KING_CONSTANTS:
+            setattr(ai_logic, name, 0)
+        ai_logic.shield_bonus = {}
+        for name in KING_CONSTANTS:
+            setattr(ai_logic, name, 1)
+            features.append(ai_logic.eval_king_safety(board))
+            setattr(ai_logic, name, 0)
+        for piece in SHIELD_PIECES:
+            ai_logic.shield_bonus = {piece: 1}
+            features.append(ai_logic.eval_king_safety(board))
+    finally:
+        for name, value in saved.items():
+            setattr(ai_logic, name, value)
+        ai_logic.shield_bonus = saved_shield
+    return features
+
+def extract_features(board):
+    # the terms weighted by phase the way eval weighs them
+    phase = ai_logic.game_phase(board)
+    phase_norm = phase / 24.0
+    pieces, signs = [], []
+    for color in chess.COLORS:
+        sign = 1 if color == chess.WHITE else -1
+        for piece in chess.PIECE_TYPES:
+            for sq in chess.scan_forward(board.pieces_mask(piece, color)):
+                pieces.append((piece - 1) * 64 + (sq if color == chess.WHITE else chess.square_mirror(sq)))
+                signs.append(sign)
+    end_game_mobility = ai_logic.eval_end_game_mobility(board)
+    dense = [
+        ai_logic.eval_pawn_structure(board) * (1 + 0.3 * (1 - phase_norm)),
+        ai_logic.eval_rook_structure(board) * (1 + 0.7 * (1 - phase_norm)),
+        ai_logic.eval_mobility(board) * phase_norm + end_game_mobility * (1 - phase_norm),
+        end_game_mobility,
+    ]
+    king_scale = ai_logic.KING_SAFETY_WEIGHT * (1 - 0.5 * (1 - phase_norm))
+    dense += [value * king_scale for value in king_safety_features(board)]
+    return pieces, signs, min(phase, PHASE_MAX) / PHASE_MAX, dense
+
+def feature_signature():
+    # everything the cached features depend on besides the positions
+    digest = hashlib.sha1()
+    for function in ai_logic.EVAL_FUNCTIONS + [extract_features, king_safety_features, quiet]:
+        digest.update(ai_logic.code_fingerprint(function.__code__))
+    digest.update(repr((ai_logic.KING_SAFETY_WEIGHT, PHASE_WEIGHTS, TERM_WEIGHTS, KING_CONSTANTS)).encode())
+    return digest.hexdigest()
+
+
+def initial_params():
+    mg = [ai_logic.MG_TABLE[piece_index(chess.WHITE, piece) * 64 + sq] for piece in chess.PIECE_TYPES for sq in chess.SQUARES]
+    eg = [ai_logic.EG_TABLE[piece_index(chess.WHITE, piece) * 64 + sq] for piece in chess.PIECE_TYPES for sq in chess.SQUARES]
+    dense = [getattr(ai_logic, name) for name in TERM_WEIGHTS + KING_CONSTANTS]
+    dense += [ai_logic.shield_bonus.get(piece, 0) for piece in SHIELD_PIECES]
+    return np.array(mg + eg + dense, dtype=np.float64)
+
+def predict(theta, pieces, signs, mg_fraction, dense):
+    tables = np.zeros((2, TABLE_SIZE + 1))
+    tables[:, :TABLE_SIZE] = theta[:2 * TABLE_SIZE].reshape(2, TABLE_SIZE)
+    mg = (tables[0][pieces] * signs).sum(axis=1)
+    eg = (tables[1][pieces] * signs).sum(axis=1)
+    return mg * mg_fraction + eg * (1 - mg_fraction) + dense @ theta[2 * TABLE_SIZE:]
+
+def win_probability(scores, k):
+    return 1 / (1 + np.exp(np.clip(-k * LN10_400 * scores, -500, 500)))
+
+
+def piece_arrays(piece_lists, sign_lists):
+    pieces = np.full((len(piece_lists), MAX_PIECES), PAD, dtype=np.int16)
+    signs = np.zeros((len(piece_lists), MAX_PIECES), dtype=np.int8)
+    for row, (piece_list, sign_list) in enumerate(zip(piece_lists, sign_lists)):
+        pieces[row, :len(piece_list)] = piece_list
+        signs[row, :len(sign_list)] = sign_list
+    return pieces, signs
+
+def _extract_chunk(chunk):
+    theta = initial_params()
+    rows = []
+    for i, (fen, result) in enumerate(chunk):
+        board = chess.Board(fen)
+        if not quiet(board):
+            continue
+        pieces, signs, mg_fraction, dense = extract_features(board)
+        rows.append((pieces, signs, mg_fraction, dense, result))
+        if i % CHECK_EVERY == 0:
+            # the linear model has to reproduce eval, or the fit tunes something else
+            expected = ai_logic.eval(board)
+            actual = predict(theta, *piece_arrays([pieces], [signs]), np.array([mg_fraction]), np.array([dense]))[0]
+            if abs(actual - expected) > ai_logic.EVAL_TOLERANCE:
+                raise AssertionError(f"texel features give {actual}, eval {expected} in {fen}")
+
+    pieces, signs = piece_arrays([row[0] for row in rows], [row[1] for row in rows])
+    return {
+        "pieces": pieces,
+        "signs": signs,
+        "mg_fraction": np.array([row[2] for row in rows], dtype=np.float32),
+        "dense": np.array([row[3] for row in rows], dtype=np.float32).reshape(len(rows), -1),
+        "results": np.array([row[4] for row in rows], dtype=np.float32),
+        "read": len(chunk),
+    }
+
+def chunks(iterable, size, limit=None):
+    chunk = []
+    for count, item in enumerate(iterable):
+        if limit is not None and count >= limit:
+            break
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def build_cache(path, cache_dir, pool, skip_plies=DEFAULT_SKIP_PLIES, limit=None, out=None):
+    parts = {name: [] for name in CACHE_ARRAYS}
+    read = kept = 0
+    for part in pool.imap(_extract_chunk, chunks(read_labelled(path, skip_plies), CHUNK_SIZE, limit)):
+        for name in CACHE_ARRAYS:
+            parts[name].append(part[name])
+        read += part["read"]
+        kept += len(part["results"])
+        if out is not None:
+            out(f"{read} positions read, {kept} quiet")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in CACHE_ARRAYS:
+        np.save(os.path.join(cache_dir, name + ".npy"), np.concatenate(parts[name]))
+    with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+        json.dump({"signature": feature_signature(), "source": cache_source(path, skip_plies, limit), "positions": kept}, f)
+    return kept
+
+def cache_source(path, skip_plies, limit):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime, skip_plies, limit]
+
+def cache_is_current(cache_dir, path, skip_plies, limit):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("signature") == feature_signature() and meta.get("source") == cache_source(path, skip_plies, limit)
+
+def load_cache(cache_dir):
+    # memory-mapped, so every worker shares the pages
+    return {name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r") for name in CACHE_ARRAYS}
+
+
+_cache = None
+
+def _init_worker(cache_dir):
+    global _cache
+    _cache = load_cache(cache_dir)
+
+def _shard_gradient(task):
+    # summed squared error and its gradient over one shard
+    theta, k, start, stop = task
+    pieces = np.asarray(_cache["pieces"][start:stop])
+    signs = np.asarray(_cache["signs"][start:stop], dtype=np.float64)
+    mg_fraction = np.asarray(_cache["mg_fraction"][start:stop], dtype=np.float64)
+    dense = np.asarray(_cache["dense"][start:stop], dtype=np.float64)
+    results = np.asarray(_cache["results"][start:stop], dtype=np.float64)
+
+    probability = win_probability(predict(theta, pieces, signs, mg_fraction, dense), k)
+    error = results - probability
+    # d(error^2)/d(score) per position
+    slope = -2 * error * probability * (1 - probability) * k * LN10_400
+    flat = pieces.ravel()
+    mg = np.bincount(flat, (signs * (slope * mg_fraction)[:, None]).ravel(), TABLE_SIZE + 1)[:TABLE_SIZE]
+    eg = np.bincount(flat, (signs * (slope * (1 - mg_fraction))[:, None]).ravel(), TABLE_SIZE + 1)[:TABLE_SIZE]
+    return float(error @ error), np.concatenate((mg, eg, slope @ dense))
+
+class Tuner:
+    def __init__(self, cache, pool):
+        self.cache = cache
+        self.pool = pool
+        self.positions = len(cache["results"])
+        shards = max(1, math.ceil(self.positions / SHARD_SIZE), (os.cpu_count() or 1) * 2)
+        bounds = np.linspace(0, self.positions, min(shards, self.positions) + 1).astype(int)
+        self.shards = list(zip(bounds[:-1], bounds[1:]))
+
+    def loss_and_gradient(self, theta, k):
+        parts = self.pool.map(_shard_gradient, [(theta, k, start, stop) for start, stop in self.shards])
+        return (sum(part[0] for part in parts) / self.positions,
+                sum(part[1] for part in parts) / self.positions)
+
+    def fit_k(self, theta, low=0.1, high=4.0, iterations=30):
+        # golden-section search for the scaling that fits the current eval best
+        ratio = (math.sqrt(5) - 1) / 2
+        for _ in range(iterations):
+            a, b = high - ratio * (high - low), low + ratio * (high - low)
+            if self.loss_and_gradient(theta, a)[0] < self.loss_and_gradient(theta, b)[0]:
+                high = b
+            else:
+                low = a
+        return (low + high) / 2
+
+    def step_sizes(self, learning_rate):
+        # Adam moves every parameter by about the same amount a step, so scale
+        # that to what moves the eval by learning_rate centipawns: table
+        # features are at most 1, dense ones are measured on the cache
+        dense = np.asarray(self.cache["dense"], dtype=np.float64)
+        active = np.maximum((dense != 0).sum(axis=0), 1)
+        typical = np.sqrt((dense ** 2).sum(axis=0) / active)
+        return learning_rate * np.concatenate((np.ones(2 * TABLE_SIZE), 1 / np.maximum(typical, 1e-9)))
+
+    def fit(self, theta, k, epochs=DEFAULT_EPOCHS, learning_rate=DEFAULT_LEARNING_RATE, out=None):
+        theta = theta.copy()
+        steps = self.step_sizes(learning_rate)
+        beta1, beta2 = ADAM_BETAS
+        m = np.zeros_like(theta)
+        v = np.zeros_like(theta)
+        for epoch in range(1, epochs + 1):
+            loss, gradient = self.loss_and_gradient(theta, k)
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            m_hat = m / (1 - beta1 ** epoch)
+            v_hat = v / (1 - beta2 ** epoch)
+            theta -= steps * m_hat / (np.sqrt(v_hat) + 1e-12)
+            if out is not None and (epoch % 10 == 0 or epoch == 1):
+                out(f"epoch {epoch}  loss {loss:.6f}")
+        return theta
+
+
+def params_from_theta(theta):
+    # The tables fix piece value and PST only together; each piece keeps the
+    # mean of its middlegame PST, and its value takes up the rest.
+    mg_tables = theta[:TABLE_SIZE].reshape(6, 64)
+    eg_tables = theta[TABLE_SIZE:2 * TABLE_SIZE].reshape(6, 64)
+    material, pst_weight = ai_logic.MATERIAL_WEIGHT, ai_logic.PST_WEIGHT
+    piece_values, pst, end_game_pst = {}, {}, {}
+    for piece in chess.PIECE_TYPES:
+        name = chess.piece_name(piece)
+        mg, eg = mg_tables[piece - 1], eg_tables[piece - 1]
+        value = 0
+        if piece != chess.KING:
+            value = round((mg.mean() - np.mean(pst_dict[piece]) * MG_PST_SCALE * pst_weight)
+                          / (material * MG_MATERIAL_SCALE))
+            piece_values[name] = value
+        pst[name] = [round(x) for x in (mg - value * material * MG_MATERIAL_SCALE) / (MG_PST_SCALE * pst_weight)]
+        end_game_pst[name] = [round(x) for x in (eg - value * material * EG_MATERIAL_SCALE) / (EG_PST_SCALE * pst_weight)]
+
+    dense = theta[2 * TABLE_SIZE:]
+    names = TERM_WEIGHTS + KING_CONSTANTS
+    return {
+        "constants": {name: round(float(value), 4) for name, value in zip(names, dense)},
+        "piece_values": piece_values,
+        "shield_bonus": {chess.piece_name(piece): round(float(value), 4)
+                         for piece, value in zip(SHIELD_PIECES, dense[len(names):])},
+        "pst": pst,
+        "end_game_pst": end_game_pst,
+    }
+
+def write_params(path, params):
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(params, f, indent=1)
+    os.replace(temp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Texel tuning of the evaluation parameters")
+    parser.add_argument("input", help="a .pgn file, anything else is read as EPD with c9 or result opcodes")
+    parser.add_argument("-o", "--output", default=ai_logic.PARAMS_FILE, help="parameter file to write")
+    parser.add_argument("--cache", default="texel_cache", help="directory for the extracted features")
+    parser.add_argument("--skip-plies", type=int, default=DEFAULT_SKIP_PLIES, help="PGN plies skipped per game")
+    parser.add_argument("--limit", type=int, help="positions read at most")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS)
+    parser.add_argument("--lr", type=float, default=DEFAULT_LEARNING_RATE, help="step per parameter in centipawns")
+    parser.add_argument("--k", type=float, help="sigmoid scaling (default: fitted to the current eval)")
+    parser.add_argument("--workers", type=int, help="pool size (default: all cores)")
+    parser.add_argument("--extract-only", action="store_true", help="build the feature cache and stop")
+    args = parser.parse_args(argv)
+
+    def out(line):
+        print(line, file=sys.stderr)
+
+    workers = args.workers or os.cpu_count() or 1
+    # spawn for the same reason as parallel_search: no inherited locks
+    context = multiprocessing.get_context("spawn")
+    if not cache_is_current(args.cache, args.input, args.skip_plies, args.limit):
+        start = time.perf_counter()
+        with context.Pool(workers) as pool:
+            positions = build_cache(args.input, args.cache, pool, args.skip_plies, args.limit, out)
+        out(f"{positions} positions cached in {time.perf_counter() - start:.1f}s")
+    if args.extract_only:
+        return 0
+
+    cache = load_cache(args.cache)
+    if not len(cache["results"]):
+        out("no positions to tune on")
+        return 1
+    with context.Pool(workers, initializer=_init_worker, initargs=(args.cache,)) as pool:
+        tuner = Tuner(cache, pool)
+        theta = initial_params()
+        k = args.k if args.k is not None else tuner.fit_k(theta)
+        before = tuner.loss_and_gradient(theta, k)[0]
+        out(f"{tuner.positions} positions  K {k:.4f}  loss {before:.6f}")
+        theta = tuner.fit(theta, k, args.epochs, args.lr, out)
+        after = tuner.loss_and_gradient(theta, k)[0]
+    out(f"loss {before:.6f} -> {after:.6f}")
+    write_params(args.output, params_from_theta(theta))
+    out(f"parameters written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
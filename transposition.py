@@ -0,0 +1,266 @@
+import chess
+import mmap
+import os
+import random
+import struct
+import time
+from array import array
+
+EXACT = 0
+LOWERBOUND = -1
+UPPERBOUND = 1
+
+ENTRY_BYTES = 24  # key (Q) + packed data (Q) + score (d)
+BUCKET_SIZE = 2   # slot 0 is depth-preferred, slot 1 is always-replace
+
+# packed data layout: move (16 bits) | depth (8) | bound (2) | age (8) | used (1)
+DEPTH_SHIFT = 16
+BOUND_SHIFT = 24
+AGE_SHIFT = 26
+USED_BIT = 1 << 34
+
+# Snapshot files: magic, format version, evaluation signature, table bytes and
+# age, padded so the table itself starts 64-byte aligned.
+TT_FILE_MAGIC = b"CETT"
+TT_FILE_VERSION = 1
+TT_FILE_HEADER = struct.Struct("<4sIQQB")
+TT_FILE_HEADER_BYTES = 64
+
+
+def encode_move(move):
+    if move is None:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decode_move(code):
+    if not code:
+        return None
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=32, buffer=None):
+        self.age = 0
+        self.attach(buffer if buffer is not None else bytearray(self.bytes_for(size_mb)))
+
+    @staticmethod
+    def bytes_for(size_mb):
+        buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SIZE))
+        return buckets * ENTRY_BYTES * BUCKET_SIZE
+
+    def attach(self, buffer):
+        # Any writable buffer works: bytearray, shared memory or an mmap.
+        self.buffer = buffer
+        view = memoryview(buffer)
+        entries = len(view) // ENTRY_BYTES
+        entries -= entries % BUCKET_SIZE
+        self.entries = entries
+        self.buckets = entries // BUCKET_SIZE
+        self.keys = view[:8 * entries].cast('Q')
+        self.data = view[8 * entries:16 * entries].cast('Q')
+        self.scores = view[16 * entries:24 * entries].cast('d')
+        self.score_bits = view[16 * entries:24 * entries].cast('Q')
+        self.reset_stats()
+
+    def resize(self, size_mb):
+        self.attach(bytearray(self.bytes_for(size_mb)))
+
+    def clear(self):
+        view = memoryview(self.buffer)
+        view[:len(view)] = bytes(len(view))
+        self.age = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    # The key slot holds key ^ data ^ score bits, so an entry half-written by
+    # another process sharing the buffer simply fails to match.
+    def key_at(self, slot):
+        return self.keys[slot] ^ self.data[slot] ^ self.score_bits[slot]
+
+    def probe(self, key):
+        self.probes += 1
+        i = (key % self.buckets) * BUCKET_SIZE
+        for slot in (i, i + 1):
+            data = self.data[slot]
+            if data & USED_BIT and self.keys[slot] ^ data ^ self.score_bits[slot] == key:
+                self.hits += 1
+                score = self.scores[slot]
+                # refresh the age so the entry survives into the next search
+                refreshed = (data & ~(0xFF << AGE_SHIFT)) | (self.age << AGE_SHIFT)
+                self.data[slot] = refreshed
+                self.keys[slot] = key ^ refreshed ^ self.score_bits[slot]
+                return ((data >> DEPTH_SHIFT) & 0xFF,
+                        score,
+                        ((data >> BOUND_SHIFT) & 3) - 1,
+                        decode_move(data & 0xFFFF))
+        return None
+
+    def store(self, key, depth, score, bound, move=None):
+        self.stores += 1
+        i = (key % self.buckets) * BUCKET_SIZE
+        data = self.data
+        move_code = encode_move(move)
+
+        if data[i + 1] & USED_BIT and self.key_at(i + 1) == key:
+            slot = i + 1
+        else:
+            slot = i
+            old = data[i]
+            if old & USED_BIT and self.key_at(i) != key:
+                old_depth = (old >> DEPTH_SHIFT) & 0xFF
+                old_age = (old >> AGE_SHIFT) & 0xFF
+                if old_age == self.age and old_depth > depth:
+                    slot = i + 1
+
+        old = data[slot]
+        if old & USED_BIT:
+            if self.key_at(slot) == key:
+                if not move_code:
+                    move_code = old & 0xFFFF
+            else:
+                self.overwrites += 1
+
+        packed = (move_code
+                  | (min(max(depth, 0), 0xFF) << DEPTH_SHIFT)
+                  | ((bound + 1) << BOUND_SHIFT)
+                  | (self.age << AGE_SHIFT)
+                  | USED_BIT)
+        self.scores[slot] = score
+        data[slot] = packed
+        self.keys[slot] = key ^ packed ^ self.score_bits[slot]
+
+    def save(self, path, signature=0):
+        view = memoryview(self.buffer)
+        header = TT_FILE_HEADER.pack(TT_FILE_MAGIC, TT_FILE_VERSION, signature, len(view), self.age)
+        # write aside and rename, so a reader never maps a half-written snapshot
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(header.ljust(TT_FILE_HEADER_BYTES, b"\0"))
+            f.write(view)
+        os.replace(temp, path)
+
+    def load(self, path, signature=0):
+        # Map a snapshot copy-on-write: pages are only read when first probed,
+        # and what the search stores never reaches the file. A snapshot from
+        # another format or evaluation is refused and the table left as it was.
+        with open(path, "rb") as f:
+            header = f.read(TT_FILE_HEADER_BYTES)
+            if len(header) < TT_FILE_HEADER_BYTES:
+                return False
+            magic, version, file_signature, size, age = TT_FILE_HEADER.unpack_from(header)
+            if magic != TT_FILE_MAGIC or version != TT_FILE_VERSION or file_signature != signature:
+                return False
+            if os.fstat(f.fileno()).st_size != TT_FILE_HEADER_BYTES + size:
+                return False
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.attach(memoryview(mapped)[TT_FILE_HEADER_BYTES:])
+        self.age = age
+        return True
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def hashfull(self):
+        # permille of the first 1000 slots used in the current search, as UCI reports it
+        sample = min(1000, self.entries)
+        used = 0
+        for slot in range(sample):
+            data = self.data[slot]
+            if data & USED_BIT and (data >> AGE_SHIFT) & 0xFF == self.age:
+                used += 1
+        return used * 1000 // sample if sample else 0
+
+    def stats(self):
+        return {
+            "size_mb": len(memoryview(self.buffer)) / (1024 * 1024),
+            "entries": self.entries,
+            "probes": self.probes,
+            "hits": self.hits,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "hit_rate": self.hit_rate(),
+        }
+
+
+class PawnHashTable:
+    # Pawn-structure scores keyed on the raw white/black pawn bitboards,
+    # one always-replace slot per index.
+    def __init__(self, size_mb=2):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.clear()
+
+    def clear(self):
+        # no real position has a pawn on every square, so BB_ALL marks an empty slot
+        self.white = array('Q', [chess.BB_ALL]) * self.entries
+        self.black = array('Q', bytes(8 * self.entries))
+        self.scores = array('d', bytes(8 * self.entries))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, white_pawns, black_pawns):
+        self.probes += 1
+        i = hash((white_pawns, black_pawns)) % self.entries
+        if self.white[i] == white_pawns and self.black[i] == black_pawns:
+            self.hits += 1
+            return self.scores[i]
+        return None
+
+    def store(self, white_pawns, black_pawns, score):
+        i = hash((white_pawns, black_pawns)) % self.entries
+        self.white[i] = white_pawns
+        self.black[i] = black_pawns
+        self.scores[i] = score
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {
+            "entries": self.entries,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate(),
+        }
+
+
+def measure_throughput(table, count=200000, seed=0):
+    rng = random.Random(seed)
+    keys = [rng.getrandbits(64) for _ in range(count)]
+    move = chess.Move.from_uci("e2e4")
+
+    start = time.perf_counter()
+    for n, key in enumerate(keys):
+        table.store(key, n & 15, float(n), EXACT, move)
+    store_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in keys:
+        table.probe(key)
+    probe_time = time.perf_counter() - start
+
+    return {
+        "stores_per_sec": count / store_time,
+        "probes_per_sec": count / probe_time,
+        "hit_rate": table.hit_rate(),
+    }
+
+
+if __name__ == "__main__":
+    for size_mb in (1, 16, 64):
+        result = measure_throughput(TranspositionTable(size_mb))
+        print(f"{size_mb:>3} MB: {result['stores_per_sec']:,.0f} stores/s, "
+              f"{result['probes_per_sec']:,.0f} probes/s, hit rate {result['hit_rate']:.1%}")
@@ -0,0 +1,230 @@
+import sys, threading
+import chess
+
+import ai_logic
+from ai_logic import MATE_SCORE, MAX_DEPTH, MAX_PLY, TT, ai_move, principal_variation, stop_search
+from zobrist import zobrist_hash, push_move
+
+# Headless UCI front end: python uci.py. Nothing here imports Qt.
+
+ENGINE_NAME = "Chess-Engine"
+ENGINE_AUTHOR = "MehdiSkilll24"
+MAX_HASH_MB = 4096
+MAX_THREADS = 64
+
+_output_lock = threading.Lock()
+
+
+def send(line):
+    with _output_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+def format_score(score, board):
+    # engine scores are from white's point of view, UCI wants the side to move's
+    if board.turn == chess.BLACK:
+        score = -score
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        # mate scores are MATE_SCORE minus the plies from the root to the mate
+        plies = max(1, int(MATE_SCORE - abs(score)))
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {int(round(score))}"
+
+
+class UciEngine:
+    def __init__(self):
+        self.board = chess.Board()
+        self.key = zobrist_hash(self.board)
+        self.search_thread = None
+        self.infinite = False
+        self.stop_requested = threading.Event()
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+
+    def handle(self, line):
+        if not line:
+            return True
+        tokens = line.split()
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            send(f"id name {ENGINE_NAME}")
+            send(f"id author {ENGINE_AUTHOR}")
+            send(f"option name Hash type spin default {ai_logic.TT_SIZE_MB} min 1 max {MAX_HASH_MB}")
+            send(f"option name Threads type spin default {ai_logic.THREADS} min 1 max {MAX_THREADS}")
+            send("option name SyzygyPath type string default <empty>")
+            send("option name HashFile type string default <empty>")
+            send("option name EvalFile type string default <empty>")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            TT.clear()
+            ai_logic.PAWN_TT.clear()
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "bench":
+            self.stop()
+            import bench
+            result = bench.run_bench(out=send)
+            bench.print_summary(result, out=send)
+        elif command == "quit":
+            self.stop()
+            if ai_logic.TT_FILE:
+                ai_logic.save_tt()
+            return False
+        return True
+
+    def set_option(self, args):
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1:args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1:])
+        self.stop()
+        if name in ("hash", "threads"):
+            try:
+                number = int(value)
+            except ValueError:
+                return   # ignore a malformed value and keep the current setting
+        if name == "hash":
+            ai_logic.TT_SIZE_MB = max(1, min(MAX_HASH_MB, number))
+            TT.resize(ai_logic.TT_SIZE_MB)
+            self.close_parallel()
+        elif name == "threads":
+            ai_logic.THREADS = max(1, min(MAX_THREADS, number))
+        elif name == "syzygypath":
+            ai_logic.SYZYGY_PATH = None if value in ("", "<empty>") else value
+        elif name == "evalfile":
+            # opened by the next search
+            ai_logic.NNUE_FILE = None if value in ("", "<empty>") else value
+        elif name == "hashfile":
+            # loaded now, written back on quit
+            ai_logic.TT_FILE = None if value in ("", "<empty>") else value
+            if ai_logic.load_tt():
+                self.close_parallel()
+
+    def close_parallel(self):
+        if "parallel_search" in sys.modules:
+            sys.modules["parallel_search"].close_all()
+
+    def set_position(self, args):
+        # a malformed FEN or an illegal move leaves the previous position in place
+        if not args:
+            return
+        try:
+            if args[0] == "startpos":
+                board = chess.Board()
+                rest = args[1:]
+            elif args[0] == "fen":
+                end = args.index("moves") if "moves" in args else len(args)
+                board = chess.Board(" ".join(args[1:end]))
+                rest = args[end:]
+            else:
+                return
+            if not board.is_valid():
+                return
+            key = zobrist_hash(board)
+            if rest and rest[0] == "moves":
+                for uci_move in rest[1:]:
+                    move = chess.Move.from_uci(uci_move)
+                    if move not in board.legal_moves:
+                        return
+                    key = push_move(board, move, key)
+        except ValueError:
+            return
+        self.board = board
+        self.key = key
+
+    def go(self, args):
+        limits = {}
+        self.infinite = False
+        i = 0
+        while i < len(args):
+            token = args[i]
+            if token == "infinite":
+                self.infinite = True
+            elif token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "nodes", "movestogo") and i + 1 < len(args):
+                try:
+                    limits[token] = int(args[i + 1])
+                except ValueError:
+                    pass   # a malformed limit is ignored, as engines usually do
+                i += 1
+            i += 1
+
+        kwargs = {}
+        if "depth" in limits:
+            kwargs["depth"] = limits["depth"]
+        if "nodes" in limits:
+            kwargs["node_limit"] = limits["nodes"]
+        if "movetime" in limits:
+            kwargs["time_limit"] = limits["movetime"] / 1000
+        elif not self.infinite:
+            clock = limits.get("wtime" if self.board.turn == chess.WHITE else "btime")
+            if clock is not None:
+                kwargs["clock"] = clock / 1000
+                kwargs["increment"] = limits.get("winc" if self.board.turn == chess.WHITE else "binc", 0) / 1000
+                kwargs["moves_to_go"] = limits.get("movestogo")
+        if self.infinite or not kwargs:
+            kwargs.setdefault("depth", MAX_DEPTH)
+
+        self.stop_requested.clear()
+        board = self.board.copy()
+        self.search_thread = threading.Thread(target=self.search, args=(board, self.key, kwargs), daemon=True)
+        self.search_thread.start()
+
+    def search(self, board, key, kwargs):
+        def report(depth, score, move, nodes, qnodes, elapsed):
+            total = nodes + qnodes
+            nps = int(total / elapsed) if elapsed > 0 else 0
+            pv = principal_variation(board, key, depth) if ai_logic.THREADS == 1 else [move]
+            if not pv or pv[0] != move:
+                pv = [move]
+            send(f"info depth {depth} score {format_score(score, board)} nodes {total} nps {nps} "
+                 f"time {int(elapsed * 1000)} hashfull {TT.hashfull()} pv {' '.join(m.uci() for m in pv)}")
+
+        # an infinite search is analysis: search the position rather than play from the book
+        move = ai_move(board, key, on_iteration=report, use_book=not self.infinite, **kwargs)
+        # in infinite mode the best move is only sent once the GUI says stop
+        if self.infinite:
+            self.stop_requested.wait()
+        if move is None:
+            send("bestmove 0000")
+        else:
+            pv = principal_variation(board, key, 2) if ai_logic.THREADS == 1 else []
+            if len(pv) == 2 and pv[0] == move:
+                send(f"bestmove {move.uci()} ponder {pv[1].uci()}")
+            else:
+                send(f"bestmove {move.uci()}")
+
+    def stop(self):
+        if self.search_thread is None:
+            return
+        self.stop_requested.set()
+        # repeat the request in case the search hadn't started when it was first sent
+        while self.search_thread.is_alive():
+            stop_search()
+            if "parallel_search" in sys.modules:
+                for search in sys.modules["parallel_search"]._searches.values():
+                    search.stop()
+            self.search_thread.join(0.05)
+        self.search_thread = None
+
+
+def main():
+    UciEngine().run()
+
+if __name__ == "__main__":
+    main()
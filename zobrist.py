@@ -0,0 +1,82 @@
+import chess
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+
+# Polyglot layout, so the same key can be used for the TT and for book lookups:
+# 12 * 64 piece keys, 4 castling keys, 8 en passant files, side to move.
+PIECE_KEYS = [[[POLYGLOT_RANDOM_ARRAY[64 * ((piece_type - 1) * 2 + color) + sq] for sq in chess.SQUARES]
+               for piece_type in chess.PIECE_TYPES] for color in (chess.BLACK, chess.WHITE)]
+CASTLING_KEYS = [(chess.BB_H1, POLYGLOT_RANDOM_ARRAY[768]),
+                 (chess.BB_A1, POLYGLOT_RANDOM_ARRAY[769]),
+                 (chess.BB_H8, POLYGLOT_RANDOM_ARRAY[770]),
+                 (chess.BB_A8, POLYGLOT_RANDOM_ARRAY[771])]
+EP_KEYS = POLYGLOT_RANDOM_ARRAY[772:780]
+TURN_KEY = POLYGLOT_RANDOM_ARRAY[780]
+
+
+def castling_hash(castling_rights):
+    key = 0
+    for mask, value in CASTLING_KEYS:
+        if castling_rights & mask:
+            key ^= value
+    return key
+
+def ep_hash(board):
+    # Only hashed when a pawn of the side to move could capture, as in Polyglot.
+    ep_square = board.ep_square
+    if ep_square is None:
+        return 0
+    if chess.BB_PAWN_ATTACKS[not board.turn][ep_square] & board.pawns & board.occupied_co[board.turn]:
+        return EP_KEYS[chess.square_file(ep_square)]
+    return 0
+
+def zobrist_hash(board):
+    key = 0
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            for sq in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                key ^= PIECE_KEYS[color][piece_type - 1][sq]
+    key ^= castling_hash(board.castling_rights) ^ ep_hash(board)
+    if board.turn == chess.WHITE:
+        key ^= TURN_KEY
+    return key
+
+def move_changes(board, move):
+    # (color, piece_type, square, +1 added / -1 removed) for every square the move touches
+    color = board.turn
+    piece_type = board.piece_type_at(move.from_square)
+    changes = [(color, piece_type, move.from_square, -1)]
+
+    if piece_type == chess.KING and board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+            king_to, rook_from, rook_to = chess.square(6, rank), chess.square(7, rank), chess.square(5, rank)
+        else:
+            king_to, rook_from, rook_to = chess.square(2, rank), chess.square(0, rank), chess.square(3, rank)
+        changes.append((color, chess.KING, king_to, 1))
+        changes.append((color, chess.ROOK, rook_from, -1))
+        changes.append((color, chess.ROOK, rook_to, 1))
+        return changes
+
+    captured = board.piece_type_at(move.to_square)
+    if captured:
+        changes.append((not color, captured, move.to_square, -1))
+    elif piece_type == chess.PAWN and move.to_square == board.ep_square:
+        ep_pawn = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+        changes.append((not color, chess.PAWN, ep_pawn, -1))
+
+    changes.append((color, move.promotion or piece_type, move.to_square, 1))
+    return changes
+
+def push_move(board, move, key, changes=None):
+    if changes is None:
+        changes = move_changes(board, move)
+    key ^= castling_hash(board.castling_rights) ^ ep_hash(board) ^ TURN_KEY
+    for color, piece_type, sq, _ in changes:
+        key ^= PIECE_KEYS[color][piece_type - 1][sq]
+    board.push(move)
+    return key ^ castling_hash(board.castling_rights) ^ ep_hash(board)
+
+def push_null(board, key):
+    key ^= ep_hash(board) ^ TURN_KEY
+    board.push(chess.Move.null())
+    return key